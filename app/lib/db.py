@@ -1,21 +1,74 @@
 from sqlmodel import SQLModel, create_engine, Session
-from sqlalchemy import text
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 import os
 
 # 本番環境でのデータベースURL設定
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./fish_tank.db")
 
-# エンジン作成時の設定を改善
-connect_args = {}
-if "sqlite" in DB_URL:
-    connect_args = {"check_same_thread": False}
+# ローカル SQLite の接続設定（全ての接続で PRAGMA を設定する）
+SQLITE_BUSY_TIMEOUT_MS = 5000          # ロック待ちの上限（超えたら "database is locked"）
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024   # メモリマップ I/O で読む範囲（バイト）
+SQLITE_CACHE_SIZE_KB = 64 * 1024       # 接続ごとのページキャッシュ（KB）
 
-engine = create_engine(
-    DB_URL, 
-    echo=False, 
-    connect_args=connect_args,
-    pool_pre_ping=True  # 接続の健全性チェック
-)
+# 接続プール: Streamlit はセッションごとのスレッドから同時に接続するので、既定（5 + 10）より多めに確保
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+
+def _is_sqlite_file(url: str) -> bool:
+    """ファイルの SQLite（メモリ上の DB 以外）かどうか"""
+    u = make_url(url)
+    return u.get_backend_name() == "sqlite" and u.database not in (None, "", ":memory:")
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    接続ごとの SQLite 設定
+
+    - WAL: 読み込みが書き込みを待たない（書き込みは1つずつのまま）
+    - synchronous=NORMAL: WAL ではコミットごとの fsync を省いても DB は壊れない（電源断時に直前のコミットが失われうる）
+    - busy_timeout: 他の接続の書き込み中はすぐにエラーにせず待つ
+    - mmap_size / cache_size: 読み込みのシステムコールとページの読み直しを減らす
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+    finally:
+        cursor.close()
+
+
+def create_db_engine(url: str, tuned: bool = True):
+    """
+    URL からエンジンを作成（ファイルの SQLite なら tuned=True で WAL などの設定とプールの大きさを適用）
+
+    tuned=False は SQLite の既定の設定（ベンチマークでの比較用）。
+    """
+    kwargs = {}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {
+            "check_same_thread": False,
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000,
+        }
+    if tuned and _is_sqlite_file(url):
+        kwargs.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=30)
+
+    db_engine = create_engine(
+        url,
+        echo=False,
+        pool_pre_ping=True,  # 接続の健全性チェック
+        **kwargs,
+    )
+    if tuned and _is_sqlite_file(url):
+        event.listen(db_engine, "connect", _set_sqlite_pragmas)
+    return db_engine
+
+
+engine = create_db_engine(DB_URL)
 
 def init_db():
     """データベースとテーブルを初期化"""
@@ -49,6 +102,11 @@ def ensure_db_compatibility():
             cols = [row.get('name') for row in info] if info else []
             if 'fish_color' not in cols:
                 conn.execute(text('ALTER TABLE "fish" ADD COLUMN fish_color TEXT DEFAULT "#FF6B6B"'))
+
+            # 復習キュー用の 'fish'.'next_due' インデックス（既存テーブルには create_all で作られない）
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_fish_next_due ON fish (next_due)'))
+            # 魚ごとの視聴イベントの範囲スキャン用（fish_events）
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_view_video_viewed ON "view" (video_id, viewed_at)'))
                 
     except Exception as e:
         print(f"データベース互換性確保エラー: {e}")
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+魚ごとの減衰係数の推定
+視聴履歴（視聴時刻と理解度）から、忘却モデル exp(-lam * 経過時間) の lam を全ての魚でまとめて最小二乗推定し、
+FishDecayRate テーブルに保存する（水槽の読み出し時の計算 tank_data.evaluate_current_state と
+視聴ログからの状態の導出 fish_events.derive_states がこの値を使う）
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+import numpy as np
+from sqlalchemy import delete, insert
+from sqlmodel import Session, select, func
+from .models import Fish, View, FishDecayRate
+from .forgetting import LAMBDA
+
+# 理解度（1: 覚えた, 2: 普通, 3: 覚えていない）→ 視聴時点での記憶の残り具合
+RETENTION_BY_COMPREHENSION = {1: 0.9, 2: 0.6, 3: 0.3}
+
+# 同じ機会の見直しとみなす間隔（時間）。これより短い間隔は推定に使わない
+MIN_GAP_HOURS = 1.0
+
+# 事前分布: 間隔 PRIOR_GAP_HOURS で LAMBDA どおりに忘れた観測を PRIOR_INTERVALS 回分加える
+# （視聴回数の少ない魚は全体の LAMBDA に近い値になる）
+PRIOR_INTERVALS = 2.0
+PRIOR_GAP_HOURS = 24.0
+
+# 推定値の範囲
+LAMBDA_MIN = 0.01
+LAMBDA_MAX = 1.0
+
+# 推定し直す間隔（視聴のたびではなく、この間隔で全ての魚をまとめて推定する）
+DECAY_FIT_INTERVAL = timedelta(days=1)
+
+
+def fit_decay_rates_arrays(video_ids, viewed_at, comprehension) -> Dict[int, tuple]:
+    """
+    視聴履歴の配列から動画ごとの減衰係数を推定（全ての動画を1回の配列計算で処理）
+
+    同じ動画の連続する視聴の組ごとに、間隔 gap（時間）と後の視聴の理解度から
+    -log(記憶の残り具合) = lam * gap の観測を作り、原点を通る最小二乗で lam を求める。
+
+    Args:
+        video_ids: 視聴の動画ID (M,)
+        viewed_at: 視聴時刻 (M,)（datetime または datetime64）
+        comprehension: 理解度 (M,)（1..3、None は使わない）
+
+    Returns:
+        dict: 動画ID → (lam, 推定に使った間隔の数)
+    """
+    video_ids = np.asarray(video_ids, dtype=np.int64)
+    times = np.asarray(viewed_at, dtype='datetime64[us]')
+    comp = np.array([c if c in RETENTION_BY_COMPREHENSION else 0 for c in comprehension], dtype=np.int64)
+    if video_ids.size == 0:
+        return {}
+
+    # 動画ごとに時刻順に並べ、隣り合う視聴の組を作る
+    order = np.lexsort((times, video_ids))
+    video_ids, times, comp = video_ids[order], times[order], comp[order]
+    videos, group = np.unique(video_ids, return_inverse=True)
+    gap = (times[1:] - times[:-1]) / np.timedelta64(1, 'h')
+    valid = (group[1:] == group[:-1]) & (comp[1:] > 0) & (gap >= MIN_GAP_HOURS)
+
+    retention = np.zeros(len(RETENTION_BY_COMPREHENSION) + 1)
+    for c, r in RETENTION_BY_COMPREHENSION.items():
+        retention[c] = r
+    g = gap[valid]
+    z = -np.log(retention[comp[1:][valid]])
+    idx = group[1:][valid]
+
+    # 原点を通る最小二乗 lam = Σ gap·z / Σ gap²（事前分布の観測を加える）
+    n = len(videos)
+    prior_gap2 = PRIOR_INTERVALS * PRIOR_GAP_HOURS ** 2
+    sum_gz = np.bincount(idx, weights=g * z, minlength=n) + prior_gap2 * LAMBDA
+    sum_g2 = np.bincount(idx, weights=g * g, minlength=n) + prior_gap2
+    lam = np.clip(sum_gz / sum_g2, LAMBDA_MIN, LAMBDA_MAX)
+    counts = np.bincount(idx, minlength=n)
+    return {int(v): (float(l), int(c)) for v, l, c in zip(videos, lam, counts)}
+
+
+def fit_decay_rates(ses: Session, video_ids: Optional[Iterable[int]] = None,
+                    now: Optional[datetime] = None) -> int:
+    """
+    視聴履歴から減衰係数を推定して FishDecayRate に保存（推定ジョブ）
+
+    Args:
+        ses: データベースセッション（commit は呼び出し側で行う）
+        video_ids: 対象の動画ID（None なら全ての魚）
+        now: 推定日時
+
+    Returns:
+        int: 保存した魚の数
+    """
+    now = now or datetime.utcnow()
+    stmt = select(View.video_id, View.viewed_at, View.comprehension).where(View.comprehension.is_not(None))
+    fish_stmt = select(Fish.id, Fish.video_id)
+    if video_ids is not None:
+        video_ids = list(video_ids)
+        stmt = stmt.where(View.video_id.in_(video_ids))
+        fish_stmt = fish_stmt.where(Fish.video_id.in_(video_ids))
+    rows = ses.exec(stmt).all()
+    fitted = fit_decay_rates_arrays([r[0] for r in rows], [r[1] for r in rows], [r[2] for r in rows])
+
+    fish_by_video = {video_id: fish_id for fish_id, video_id in ses.exec(fish_stmt).all()}
+    params = [
+        {'fish_id': fish_by_video[video_id], 'lam': lam, 'n_intervals': count, 'fitted_at': now}
+        for video_id, (lam, count) in fitted.items() if video_id in fish_by_video
+    ]
+    if not params:
+        return 0
+    # 既存の推定値を置き換える（DB の種類によらない delete + bulk insert）
+    ses.exec(delete(FishDecayRate).where(FishDecayRate.fish_id.in_([p['fish_id'] for p in params])))
+    ses.exec(insert(FishDecayRate), params=params)
+    return len(params)
+
+
+def decay_rates_stale(ses: Session, now: Optional[datetime] = None) -> bool:
+    """前回の推定から DECAY_FIT_INTERVAL 以上経っているか（一度も推定していなければ True）"""
+    now = now or datetime.utcnow()
+    last = ses.exec(select(func.max(FishDecayRate.fitted_at))).one()
+    return last is None or now - last >= DECAY_FIT_INTERVAL
+
+
+def load_decay_rates(ses: Session, fish_ids: Iterable[int]) -> Dict[int, float]:
+    """魚ID → 推定済みの減衰係数（未推定の魚は含まない）"""
+    fish_ids = list(fish_ids)
+    if not fish_ids:
+        return {}
+    stmt = select(FishDecayRate.fish_id, FishDecayRate.lam).where(FishDecayRate.fish_id.in_(fish_ids))
+    return {fish_id: lam for fish_id, lam in ses.exec(stmt).all()}
+
+
+if __name__ == '__main__':
+    # 全ての魚を推定し直す: python -m app.lib.decay_fit
+    from .db import init_db, get_session
+    from .fish_events import refit_decay_rates
+    init_db()
+    with get_session() as ses:
+        count = refit_decay_rates(ses)
+        ses.commit()
+    print(f"{count} 匹の減衰係数が変わりました")
@@ -3,19 +3,86 @@
 動的魚生成システム - SUPABASE連携版
 ユーザーの学習データに基づいて魚を生成
 """
-from PIL import Image, ImageDraw, ImageFilter, ImageEnhance
+import numpy as np
 import random
-import io
-import base64
 import math
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, List, Any, Tuple, Optional, Union
+from .fish_image_cache import FishImageCache, cache_key, get_fish_image_cache
+from . import fish_rasterizer as raster
+from . import fish_shapes as shapes_
+from . import fish_svg
+from .genre_classifier import DEFAULT_GENRE, detect_genre
+from .fish_ranking import FishRankIndex
+
+# 描画ロジックを変更したら上げる（ディスクキャッシュの古い画像を使わないため）
+FISH_RENDER_VERSION = 4
+
+# 出力形式（png: Base64 PNG、svg: SVG 文書の文字列）
+OUTPUT_FORMATS = ("png", "svg")
+
+# これ未満の枚数はプロセスプールを使わず直列で描画する
+# （benchmarks/fish_generation.py で計測。直列は1枚 0.75 ms 程度なので、spawn でのプール起動 250 ms 程度を
+#   4 コア以上で取り戻せる枚数にする。起動済みのプールなら受け渡しの差は 1 ms 程度）
+PARALLEL_MIN_BATCH = 512
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_worker_generator: Optional["AdvancedFishGenerator"] = None
+
+
+def render_worker_count() -> int:
+    """描画用プロセスプールのワーカー数（CPU コア数）"""
+    return os.cpu_count() or 1
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    """描画用のプロセスプールを取得（render_worker_count() 個のワーカーで1回だけ起動し使い回す）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Streamlit はマルチスレッドなので fork ではなく spawn で起動する
+            _executor = ProcessPoolExecutor(max_workers=render_worker_count(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def shutdown_render_executor():
+    """描画用のプロセスプールを停止"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def fish_image_data_uri(image: str, output_format: str = "png") -> str:
+    """生成した魚画像（Base64 PNG または SVG 文書）を img タグや st.image で使える data URI に変換"""
+    if output_format == "svg":
+        return fish_svg.svg_data_uri(image)
+    return f"data:image/png;base64,{image}"
+
+
+def _render_jobs_in_worker(jobs: List[tuple]) -> List[Optional[str]]:
+    """ワーカープロセス側の描画（キャッシュは親プロセスが管理するので使わない）"""
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = AdvancedFishGenerator(cache=FishImageCache(cache_dir=None, memory_items=0))
+    return _worker_generator._render_jobs(jobs)
 
 
 class AdvancedFishGenerator:
     """SUPABASEデータ連携高度魚生成クラス"""
     
-    def __init__(self):
+    def __init__(self, cache: Optional[FishImageCache] = None):
+        # 生成済み画像のキャッシュ（同じ入力の魚は再描画しない）
+        self.cache = cache if cache is not None else get_fish_image_cache()
+        
         # 基本色パレット（学習パターン別）
         self.learning_style_colors = {
             "focused": {
@@ -37,11 +104,39 @@ class AdvancedFishGenerator:
         
         # 理解度レベル別の魚の形状
         self.comprehension_shapes = {
-            "easy": "round",    # 丸い、可愛らしい
-            "medium": "normal", # 標準的な魚の形
-            "hard": "sharp"     # 鋭い、高級感
+            "easy": shapes_.SHAPE_ROUND,    # 丸い、可愛らしい
+            "medium": shapes_.SHAPE_NORMAL, # 標準的な魚の形
+            "hard": shapes_.SHAPE_SHARP     # 鋭い、高級感
+        }
+        
+        # レア魚の配色（実績の種類別、その他はピンク系）
+        self.rare_colors = {
+            "streak": ["#FFD700", "#FFA500", "#FF6347"],         # 連続学習記録達成（ゴールド系）
+            "comprehension": ["#9370DB", "#8A2BE2", "#4B0082"],  # 高理解度達成（紫系）
+            "volume": ["#00CED1", "#20B2AA", "#008B8B"],         # 大量学習達成（ティール系）
+        }
+        self.default_rare_colors = ["#FF1493", "#FF69B4", "#FFB6C1"]
+        
+        # ジャンル別の配色（genre_classifier のジャンル名）
+        self.genre_colors = {
+            "プログラミング": {"primary": "#3776AB", "secondary": "#FFD43B", "accent": "#4B8BBE"},
+            "数学": {"primary": "#5C6BC0", "secondary": "#26A69A", "accent": "#FFCA28"},
+            "理科": {"primary": "#43A047", "secondary": "#00ACC1", "accent": "#C0CA33"},
+            "歴史": {"primary": "#8D6E63", "secondary": "#D4A017", "accent": "#B71C1C"},
+            "語学": {"primary": "#E53935", "secondary": "#1E88E5", "accent": "#FFFFFF"},
+            "音楽": {"primary": "#8E24AA", "secondary": "#EC407A", "accent": "#FFD54F"},
+            "料理": {"primary": "#FB8C00", "secondary": "#F4511E", "accent": "#FFF176"},
+            "スポーツ": {"primary": "#1E88E5", "secondary": "#43A047", "accent": "#FFFFFF"},
+            "アート": {"primary": "#F06292", "secondary": "#BA68C8", "accent": "#4DD0E1"},
+            "ビジネス": {"primary": "#37474F", "secondary": "#1565C0", "accent": "#FFB300"},
+            DEFAULT_GENRE: {"primary": "#FF7F50", "secondary": "#FFA07A", "accent": "#FFD700"},
         }
         
+        # 総合スコア → ランク（スコアの下限とランク名、上から順に判定）
+        self.rank_thresholds = [(0.85, "S"), (0.7, "A"), (0.5, "B"), (0.3, "C"), (0.0, "D")]
+        # ランク → 胴体の形（上位ほど鋭く高級感のある形）
+        self.rank_shapes = {"S": "hard", "A": "hard", "B": "medium", "C": "easy", "D": "easy"}
+        
         # 学習頻度別のアニメーション速度
         self.frequency_animations = {
             "sporadic": 0.3,   # ゆっくり
@@ -53,151 +148,59 @@ class AdvancedFishGenerator:
                                  user_patterns: Dict[str, Any],
                                  video_title: str = "",
                                  video_id: str = "",
-                                 size: tuple = (120, 80)) -> Optional[str]:
-        """ユーザーの学習データに基づいて個人化された魚を生成"""
-        try:
-            # ベース画像作成
-            img = Image.new('RGBA', size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-            
-            # 学習パターンから色を決定
-            learning_style = user_patterns.get("learning_style", "balanced")
-            colors = self.learning_style_colors[learning_style]
-            
-            # エンゲージメントスコアに基づくサイズ調整
-            engagement = user_stats.get("engagement_score", 0.5)
-            scale = 0.7 + (engagement * 0.6)  # 0.7-1.3倍
-            
-            # 魚の基本形状を描画
-            self._draw_fish_body(draw, size, colors, user_patterns, scale)
-            
-            # 理解度に基づく装飾追加
-            self._add_comprehension_decorations(draw, size, user_stats, colors)
-            
-            # 学習ストリークに基づく特別効果
-            self._add_streak_effects(img, user_patterns.get("learning_streaks", 0))
-            
-            # 時間帯に基づく背景効果
-            self._add_time_based_effects(img, user_patterns.get("best_performance_time", "morning"))
-            
-            # Base64エンコード
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            return base64.b64encode(buffer.getvalue()).decode()
-            
-        except Exception as e:
-            print(f"魚生成エラー: {e}")
-            return None
-    
-    def _draw_fish_body(self, draw: ImageDraw.Draw, size: tuple, colors: Dict, 
-                       patterns: Dict, scale: float):
-        """魚の本体を描画"""
-        w, h = size
-        center_x, center_y = w // 2, h // 2
-        
-        # サイズ調整
-        body_width = int(w * 0.4 * scale)
-        body_height = int(h * 0.6 * scale)
-        
-        # 理解度レベルに基づく形状
-        difficulty = patterns.get("preferred_difficulty", "medium")
-        
-        if difficulty == "easy":
-            # 丸い魚
-            draw.ellipse([
-                center_x - body_width, center_y - body_height//2,
-                center_x + body_width//2, center_y + body_height//2
-            ], fill=colors["primary"])
-        elif difficulty == "hard":
-            # 鋭い魚
-            points = [
-                (center_x - body_width, center_y),
-                (center_x - body_width//2, center_y - body_height//2),
-                (center_x + body_width//2, center_y - body_height//3),
-                (center_x + body_width//2, center_y + body_height//3),
-                (center_x - body_width//2, center_y + body_height//2)
-            ]
-            draw.polygon(points, fill=colors["primary"])
-        else:
-            # 標準的な魚
-            draw.ellipse([
-                center_x - body_width, center_y - body_height//2,
-                center_x + body_width//2, center_y + body_height//2
-            ], fill=colors["primary"])
-        
-        # 尻尾
-        tail_points = [
-            (center_x + body_width//2, center_y - body_height//4),
-            (center_x + body_width, center_y),
-            (center_x + body_width//2, center_y + body_height//4)
-        ]
-        draw.polygon(tail_points, fill=colors["secondary"])
-        
-        # 目
-        eye_size = max(4, int(8 * scale))
-        draw.ellipse([
-            center_x - body_width//2 - eye_size, center_y - eye_size//2,
-            center_x - body_width//2 + eye_size, center_y + eye_size//2
-        ], fill='white')
-        draw.ellipse([
-            center_x - body_width//2 - eye_size//2, center_y - eye_size//4,
-            center_x - body_width//2 + eye_size//2, center_y + eye_size//4
-        ], fill='black')
+                                 size: tuple = (120, 80),
+                                 output_format: str = "png") -> Optional[str]:
+        """
+        ユーザーの学習データに基づいて個人化された魚を生成
+
+        output_format が "png" なら Base64 PNG、"svg" なら SVG 文書を返す
+        （表示用の data URI は fish_image_data_uri で作る）
+        """
+        key = cache_key('personalized', FISH_RENDER_VERSION,
+                        self._personalized_inputs(user_stats, user_patterns, size), output_format)
+        return self.cache.get_or_create(
+            key, lambda: self._render_personalized_fish(user_stats, user_patterns, size, output_format)
+        )
     
-    def _add_comprehension_decorations(self, draw: ImageDraw.Draw, size: tuple, 
-                                     user_stats: Dict, colors: Dict):
-        """理解度に基づく装飾を追加"""
-        avg_comprehension = user_stats.get("avg_comprehension", 1.5)
-        
-        if avg_comprehension >= 2.5:  # 高理解度
-            # 王冠のような装飾
-            w, h = size
-            center_x = w // 2
-            crown_points = [
-                (center_x - 15, h // 4),
-                (center_x - 10, h // 6),
-                (center_x - 5, h // 4 - 2),
-                (center_x, h // 6 - 3),
-                (center_x + 5, h // 4 - 2),
-                (center_x + 10, h // 6),
-                (center_x + 15, h // 4)
-            ]
-            draw.polygon(crown_points, fill=colors["accent"])
-        elif avg_comprehension >= 2.0:  # 中理解度
-            # シンプルな装飾
-            w, h = size
-            center_x = w // 2
-            draw.polygon([
-                (center_x - 8, h // 4),
-                (center_x, h // 6),
-                (center_x + 8, h // 4)
-            ], fill=colors["accent"])
+    def _personalized_inputs(self, user_stats: Dict[str, Any], user_patterns: Dict[str, Any],
+                             size: tuple) -> Dict[str, Any]:
+        """描画結果に影響する入力だけを取り出す（キャッシュキー用）"""
+        return {
+            "learning_style": user_patterns.get("learning_style", "balanced"),
+            "preferred_difficulty": user_patterns.get("preferred_difficulty", "medium"),
+            "learning_streaks": user_patterns.get("learning_streaks", 0),
+            "best_performance_time": user_patterns.get("best_performance_time", "morning"),
+            "engagement_score": user_stats.get("engagement_score", 0.5),
+            "avg_comprehension": user_stats.get("avg_comprehension", 1.5),
+            "size": list(size),
+        }
     
-    def _add_streak_effects(self, img: Image.Image, streak_days: int):
-        """学習ストリークに基づく特別効果"""
-        if streak_days >= 7:  # 1週間以上の連続学習
-            # 輝き効果
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(1.2)
-            
-            # 若干のブラー効果でオーラ感
-            if streak_days >= 30:  # 1ヶ月以上
-                blur = img.filter(ImageFilter.GaussianBlur(radius=1))
-                img = Image.alpha_composite(blur, img)
+    def _render_personalized_fish(self, user_stats: Dict[str, Any], user_patterns: Dict[str, Any],
+                                  size: tuple, output_format: str = "png") -> Optional[str]:
+        """個人化された魚を実際に描画する（1匹分のバッチ描画）"""
+        inputs = self._personalized_inputs(user_stats, user_patterns, size)
+        return self._render_jobs([('personalized', inputs, output_format)])[0]
     
-    def _add_time_based_effects(self, img: Image.Image, best_time: str):
-        """最適学習時間に基づく背景効果"""
+    def _effect_params(self, p: Dict[str, Any]) -> tuple:
+        """
+        学習ストリーク・最適学習時間に基づく特別効果を (明るさ, 彩度, オーラ) にまとめる
+
+        画像のコピーを何度も作らず、明るさ・彩度はパレットに、オーラは描画後に1回だけ掛ける。
+        """
+        streak_days = p["learning_streaks"]
+        best_time = p["best_performance_time"]
+        brightness = 1.2 if streak_days >= 7 else 1.0  # 1週間以上の連続学習: 輝き効果
+        aura = streak_days >= 30                       # 1ヶ月以上: ぼかしでオーラ感
         if best_time == "morning":
-            # 朝の明るい効果
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(1.1)
+            saturation = 1.1  # 朝の明るい効果
         elif best_time == "night":
-            # 夜の深い色調
-            enhancer = ImageEnhance.Color(img)
-            img = enhancer.enhance(0.8)
+            saturation = 0.8  # 夜の深い色調
+        else:
+            saturation = 1.0
+        return brightness, saturation, aura
     
     def generate_evolution_fish(self, base_fish_stats: Dict, new_stats: Dict, 
-                              video_title: str = "") -> Optional[str]:
+                              video_title: str = "", output_format: str = "png") -> Optional[str]:
         """既存の魚を進化させる"""
         # 成長度合いを計算
         old_engagement = base_fish_stats.get("engagement_score", 0.5)
@@ -206,105 +209,296 @@ class AdvancedFishGenerator:
         
         # サイズを大きく
         new_size = (int(120 * growth_factor), int(80 * growth_factor))
-        return self.generate_personalized_fish(new_stats, {}, video_title, "", new_size)
+        return self.generate_personalized_fish(new_stats, {}, video_title, "", new_size, output_format)
     
-    def generate_rare_fish(self, user_stats: Dict, achievement_type: str = "streak") -> Optional[str]:
-        """特別な成果に基づくレア魚生成"""
-        size = (150, 100)  # 大きめサイズ
-        
-        try:
-            img = Image.new('RGBA', size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(img)
-            
-            if achievement_type == "streak":
-                # 連続学習記録達成
-                colors = ["#FFD700", "#FFA500", "#FF6347"]  # ゴールド系
-            elif achievement_type == "comprehension":
-                # 高理解度達成
-                colors = ["#9370DB", "#8A2BE2", "#4B0082"]  # 紫系
-            elif achievement_type == "volume":
-                # 大量学習達成
-                colors = ["#00CED1", "#20B2AA", "#008B8B"]  # ティール系
+    def generate_many(self, specs: List[Dict[str, Any]],
+                      parallel_threshold: Optional[int] = None) -> List[Optional[str]]:
+        """
+        複数の魚画像をまとめて生成
+
+        Args:
+            specs: 生成指定のリスト。kind（"personalized" / "evolution" / "rare"）と
+                   対応する generate_*_fish の引数（user_stats, user_patterns, size,
+                   base_fish_stats, new_stats, achievement_type）、出力形式 format
+                   （"png" / "svg"、省略時 "png"）を持つ dict
+            parallel_threshold: 未キャッシュの枚数がこれ以上ならプロセスプールで並列描画
+                                （省略時 PARALLEL_MIN_BATCH）
+
+        Returns:
+            list: specs と同じ順番の画像（Base64 PNG または SVG 文書、生成失敗は None）
+        """
+        if parallel_threshold is None:
+            parallel_threshold = PARALLEL_MIN_BATCH
+
+        results: List[Optional[str]] = [None] * len(specs)
+        pending: Dict[str, Tuple[tuple, List[int]]] = {}  # key → (描画ジョブ, 結果の位置)
+        for i, spec in enumerate(specs):
+            key, job = self._spec_job(spec)
+            if key in pending:
+                pending[key][1].append(i)
+                continue
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
             else:
-                colors = ["#FF1493", "#FF69B4", "#FFB6C1"]  # ピンク系
-            
-            # レアな装飾付きの魚を描画
-            self._draw_rare_fish_body(draw, size, colors)
-            
-            # 特別エフェクト
-            enhancer = ImageEnhance.Brightness(img)
-            img = enhancer.enhance(1.3)
-            
-            buffer = io.BytesIO()
-            img.save(buffer, format='PNG')
-            return base64.b64encode(buffer.getvalue()).decode()
-            
-        except Exception as e:
-            print(f"レア魚生成エラー: {e}")
-            return None
+                pending[key] = (job, [i])
+
+        if not pending:
+            return results
+
+        keys = list(pending)
+        jobs = [pending[k][0] for k in keys]
+        rendered = None
+        if len(jobs) >= parallel_threshold and render_worker_count() > 1:
+            try:
+                rendered = self._render_jobs_parallel(jobs)
+            except (BrokenProcessPool, OSError) as e:
+                print(f"並列描画エラー（直列描画に切り替えます）: {e}")
+                shutdown_render_executor()
+        if rendered is None:
+            rendered = self._render_jobs(jobs)
+
+        for key, image in zip(keys, rendered):
+            if image is None:
+                continue
+            self.cache.put(key, image)
+            for i in pending[key][1]:
+                results[i] = image
+        return results
+
+    def _spec_job(self, spec: Dict[str, Any]) -> Tuple[str, tuple]:
+        """生成指定をキャッシュキーと描画ジョブ（プロセス間で受け渡せるタプル）に変換"""
+        kind = spec.get("kind", "personalized")
+        output_format = spec.get("format", "png")
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"未対応の出力形式です: {output_format}")
+        if kind == "rare":
+            achievement_type = spec.get("achievement_type", "streak")
+            return (cache_key('rare', FISH_RENDER_VERSION, achievement_type, output_format),
+                    ('rare', achievement_type, output_format))
+
+        if kind == "evolution":
+            # generate_evolution_fish と同じ成長計算
+            new_stats = spec.get("new_stats", {})
+            old_engagement = spec.get("base_fish_stats", {}).get("engagement_score", 0.5)
+            new_engagement = new_stats.get("engagement_score", 0.5)
+            growth_factor = max(0.1, min(2.0, new_engagement / max(old_engagement, 0.1)))
+            user_stats, user_patterns = new_stats, {}
+            size = (int(120 * growth_factor), int(80 * growth_factor))
+        else:
+            user_stats = spec.get("user_stats", {})
+            user_patterns = spec.get("user_patterns", {})
+            size = tuple(spec.get("size", (120, 80)))
+
+        inputs = self._personalized_inputs(user_stats, user_patterns, size)
+        return (cache_key('personalized', FISH_RENDER_VERSION, inputs, output_format),
+                ('personalized', inputs, output_format))
+
+    def _render_jobs_parallel(self, jobs: List[tuple]) -> List[Optional[str]]:
+        """描画ジョブをワーカー数で分割し、各ワーカーで1回ずつバッチ描画する"""
+        step = math.ceil(len(jobs) / render_worker_count())
+        parts = get_render_executor().map(_render_jobs_in_worker, [jobs[i:i + step] for i in range(0, len(jobs), step)])
+        return [image for part in parts for image in part]
+
+    def _render_jobs(self, jobs: List[tuple]) -> List[Optional[str]]:
+        """
+        描画ジョブをまとめて描画（キャッシュは使わない）
+
+        PNG は種類とキャンバスサイズが同じ魚ごとにバッチラスタライザで一括描画し、
+        1枚ずつエンコードする。SVG は同じ形の定義から文書を組み立てるだけ。
+        """
+        results: List[Optional[str]] = [None] * len(jobs)
+        groups: Dict[tuple, List[int]] = {}
+        for i, (kind, params, output_format) in enumerate(jobs):
+            size = shapes_.RARE_SIZE if kind == 'rare' else tuple(params["size"])
+            groups.setdefault((kind, size, output_format), []).append(i)
+
+        for (kind, size, output_format), indices in groups.items():
+            params = [jobs[i][1] for i in indices]
+            try:
+                images = self._render_group(kind, size, output_format, params)
+            except Exception:
+                # どれか1つの指定が不正でもグループ全体を失わないよう、1枚ずつ描き直す（失敗した分だけ None）
+                images = []
+                for p in params:
+                    try:
+                        images.extend(self._render_group(kind, size, output_format, [p]))
+                    except Exception as e:
+                        print(f"魚生成エラー: {e}")
+                        images.append(None)
+            for i, image in zip(indices, images):
+                results[i] = image
+        return results
+
+    def _render_group(self, kind: str, size: tuple, output_format: str, params: List[Any]) -> List[str]:
+        """種類・キャンバスサイズ・出力形式が同じ魚をまとめて描画"""
+        if output_format == 'svg':
+            return self._svg_rare(params) if kind == 'rare' else self._svg_personalized(params, size)
+        if kind == 'rare':
+            return self._rasterize_rare(params)
+        return self._rasterize_personalized(params, size)
+
+    def _shape_params(self, p: Dict[str, Any]) -> Tuple[float, int, Dict[str, str]]:
+        """個人化魚の入力から拡大率・形状コード・配色を求める"""
+        # エンゲージメントスコアに基づくサイズ調整（0.7-1.3倍）
+        scale = 0.7 + (p["engagement_score"] * 0.6)
+        # 理解度レベルに基づく形状（未知の値は標準形）
+        shape = self.comprehension_shapes.get(p["preferred_difficulty"], shapes_.SHAPE_NORMAL)
+        # ジャンル指定があればジャンルの配色、なければ学習パターンの配色
+        if "genre" in p:
+            return scale, shape, self.genre_colors.get(p["genre"], self.genre_colors[DEFAULT_GENRE])
+        return scale, shape, self.learning_style_colors[p["learning_style"]]
+
+    def _svg_personalized(self, inputs: List[Dict[str, Any]], size: tuple) -> List[str]:
+        """個人化魚を SVG 文書として作成"""
+        images = []
+        for p in inputs:
+            scale, shape, colors = self._shape_params(p)
+            brightness, saturation, aura = self._effect_params(p)
+            images.append(fish_svg.personalized_svg(size, scale, shape, p["avg_comprehension"],
+                                                    colors["primary"], colors["secondary"], colors["accent"],
+                                                    brightness=brightness, saturation=saturation, aura=aura))
+        return images
+
+    def _svg_rare(self, achievement_types: List[str]) -> List[str]:
+        """レア魚を SVG 文書として作成（特別エフェクトの明るさは色に反映）"""
+        return [fish_svg.rare_svg(self.rare_colors.get(a, self.default_rare_colors), brightness=1.3)
+                for a in achievement_types]
+
+    def _rasterize_personalized(self, inputs: List[Dict[str, Any]], size: tuple) -> List[str]:
+        """同じサイズの個人化魚をまとめて描画"""
+        scales, shapes, palettes = zip(*(self._shape_params(p) for p in inputs))
+        # 学習ストリーク・時間帯に基づく特別効果
+        brightness, saturation, aura = zip(*(self._effect_params(p) for p in inputs))
+        images = raster.rasterize_personalized(
+            size,
+            scales=scales,
+            shapes=shapes,
+            comprehensions=[p["avg_comprehension"] for p in inputs],
+            primary=np.array([raster.to_rgba(c["primary"]) for c in palettes], dtype=np.uint8),
+            secondary=np.array([raster.to_rgba(c["secondary"]) for c in palettes], dtype=np.uint8),
+            accent=np.array([raster.to_rgba(c["accent"]) for c in palettes], dtype=np.uint8),
+            brightness=np.array(brightness, dtype=np.float32),
+            saturation=np.array(saturation, dtype=np.float32),
+            aura=np.array(aura, dtype=bool),
+        )
+        return raster.encode_batch(images)
+
+    def _rasterize_rare(self, achievement_types: List[str]) -> List[str]:
+        """レア魚をまとめて描画（大きめサイズ、特別エフェクトで明るく）"""
+        palettes = np.array([
+            [raster.to_rgba(c) for c in self.rare_colors.get(a, self.default_rare_colors)]
+            for a in achievement_types
+        ], dtype=np.uint8)
+        return raster.encode_batch(raster.rasterize_rare(shapes_.RARE_SIZE, palettes, brightness=1.3))
+
+    def generate_rare_fish(self, user_stats: Dict, achievement_type: str = "streak",
+                           output_format: str = "png") -> Optional[str]:
+        """特別な成果に基づくレア魚生成（output_format は generate_personalized_fish と同じ）"""
+        # レア魚の見た目は実績の種類だけで決まる
+        key = cache_key('rare', FISH_RENDER_VERSION, achievement_type, output_format)
+        return self.cache.get_or_create(key, lambda: self._render_rare_fish(achievement_type, output_format))
     
-    def _draw_rare_fish_body(self, draw: ImageDraw.Draw, size: tuple, colors: List[str]):
-        """レア魚の本体を描画"""
-        w, h = size
-        center_x, center_y = w // 2, h // 2
-        
-        # グラデーション風の多色魚体
-        for i, color in enumerate(colors):
-            offset = i * 3
-            draw.ellipse([
-                center_x - 50 + offset, center_y - 25 + offset,
-                center_x + 30 - offset, center_y + 25 - offset
-            ], fill=color)
-        
-        # 豪華な尻尾
-        tail_colors = colors[::-1]  # 逆順
-        for i, color in enumerate(tail_colors):
-            offset = i * 2
-            tail_points = [
-                (center_x + 30 - offset, center_y - 15 + offset),
-                (center_x + 60 + i*5, center_y),
-                (center_x + 30 - offset, center_y + 15 - offset)
-            ]
-            draw.polygon(tail_points, fill=color)
-        
-        # 特別な目
-        draw.ellipse([center_x - 35, center_y - 8, center_x - 20, center_y + 8], fill='white')
-        draw.ellipse([center_x - 32, center_y - 5, center_x - 23, center_y + 5], fill='black')
-        draw.ellipse([center_x - 29, center_y - 2, center_x - 26, center_y + 2], fill='white')  # ハイライト
+    def _render_rare_fish(self, achievement_type: str, output_format: str = "png") -> Optional[str]:
+        """レア魚を実際に描画する（1匹分のバッチ描画）"""
+        return self._render_jobs([('rare', achievement_type, output_format)])[0]
     
-    def calculate_fish_rank(self, user_stats: Dict, all_users_stats: List[Dict]) -> Tuple[str, int]:
-        """ユーザーの相対的なランクを計算"""
+    def calculate_fish_rank(self, user_stats: Dict,
+                            all_users_stats: Union[List[Dict], FishRankIndex]) -> Tuple[str, int]:
+        """
+        ユーザーの相対的なランクを計算
+        
+        all_users_stats には全ユーザーの統計リストか、作成済みの FishRankIndex を渡す。
+        複数ユーザーを順位付けするときは索引を1回作って渡す（または calculate_fish_ranks を使う）と、
+        1人あたり二分探索1回で済む。
+        """
         if not all_users_stats:
             return "初心者", 1
         
-        user_engagement = user_stats.get("engagement_score", 0.0)
-        
-        # 全ユーザーの中での順位を計算
-        sorted_users = sorted(all_users_stats, key=lambda x: x.get("engagement_score", 0.0), reverse=True)
-        user_rank = len(sorted_users)
-        
-        for i, stats in enumerate(sorted_users):
-            if stats.get("engagement_score", 0.0) <= user_engagement:
-                user_rank = i + 1
-                break
-        
-        total_users = len(sorted_users)
-        percentile = (user_rank / total_users) * 100
-        
-        if percentile <= 10:
-            return "マスター", user_rank
-        elif percentile <= 25:
-            return "エキスパート", user_rank
-        elif percentile <= 50:
-            return "上級者", user_rank
-        elif percentile <= 75:
-            return "中級者", user_rank
-        else:
-            return "初心者", user_rank
+        index = all_users_stats if isinstance(all_users_stats, FishRankIndex) \
+            else FishRankIndex.from_stats(all_users_stats, key=None)
+        return index.rank_of_score_with_tier(user_stats.get("engagement_score", 0.0))
+    
+    def calculate_fish_ranks(self, all_users_stats: List[Dict]) -> List[Tuple[str, int]]:
+        """全ユーザーのランクをまとめて計算（all_users_stats と同じ順番）"""
+        index = FishRankIndex.from_stats(all_users_stats, key=None)
+        return [index.rank_of_score_with_tier(stats.get("engagement_score", 0.0)) for stats in all_users_stats]
 
 
 class DynamicFishGenerator(AdvancedFishGenerator):
-    """後方互換性のための従来クラス"""
+    """後方互換性のための従来クラス（動画情報ベースの魚生成 API を含む）"""
+    
+    def detect_genre_from_title(self, title: str) -> str:
+        """動画タイトルからジャンルを判定（genre_classifier、タイトルごとにキャッシュ）"""
+        return detect_genre(title)
+    
+    def generate_fish_colors_by_genre(self, genre: str) -> Dict[str, str]:
+        """ジャンルの配色（primary / secondary / accent）を取得"""
+        return dict(self.genre_colors.get(genre, self.genre_colors[DEFAULT_GENRE]))
+    
+    def _rank_score(self, youtube_views: int, published_at, user_comprehension: float,
+                    user_view_count: int) -> float:
+        """動画の人気度と学習状況から 0..1 の総合スコアを計算"""
+        # 人気度: 1日あたりの再生回数（対数、1日10万回で最大）
+        if isinstance(published_at, str):
+            published_at = datetime.fromisoformat(published_at.replace("Z", "+00:00"))
+        if published_at is None:
+            days = 1.0
+        else:
+            if published_at.tzinfo is None:
+                published_at = published_at.replace(tzinfo=timezone.utc)
+            days = max(1.0, (datetime.now(timezone.utc) - published_at).total_seconds() / 86400)
+        views_per_day = max(0, youtube_views or 0) / days
+        popularity = min(1.0, math.log10(1 + views_per_day) / 5)
+        # 学習状況: 理解度（1..3）と視聴回数（5回で最大）
+        comprehension = max(0.0, min(1.0, ((user_comprehension or 1) - 1) / 2))
+        repetition = min(1.0, max(0, user_view_count or 0) / 5)
+        return 0.3 * popularity + 0.4 * comprehension + 0.3 * repetition
+    
+    def calculate_fish_rank_from_views_and_learning(self, youtube_views: int, published_at,
+                                                    user_comprehension: float,
+                                                    user_view_count: int) -> Tuple[str, Tuple[int, int]]:
+        """
+        動画の再生回数・公開日とユーザーの理解度・視聴回数から魚のランクとサイズを計算
+        
+        Returns:
+            tuple: (ランク "S"〜"D", 画像サイズ (幅, 高さ))。サイズはスコアに応じて 0.8〜1.4 倍
+        """
+        score = self._rank_score(youtube_views, published_at, user_comprehension, user_view_count)
+        return self._rank_from_score(score)
+    
+    def _rank_from_score(self, score: float) -> Tuple[str, Tuple[int, int]]:
+        rank = next(name for threshold, name in self.rank_thresholds if score >= threshold)
+        factor = 0.8 + 0.6 * score
+        return rank, (int(120 * factor), int(80 * factor))
+    
+    def generate_fish_with_advanced_features(self, video_title: str, user_id: str = "",
+                                             video_id: str = "", youtube_views: int = 0,
+                                             published_at=None, user_comprehension: float = 1.5,
+                                             user_view_count: int = 0,
+                                             output_format: str = "png") -> Optional[str]:
+        """
+        動画情報と学習状況から魚を生成（ジャンルで配色、ランクで形とサイズが決まる）
+        
+        見た目はタイトルのジャンルとランク・理解度だけで決まるため、user_id / video_id は
+        描画に使わない（呼び出し側との互換のために受け取る）。
+        
+        Returns:
+            Optional[str]: output_format に応じた Base64 PNG または SVG 文書
+        """
+        genre = self.detect_genre_from_title(video_title)
+        score = self._rank_score(youtube_views, published_at, user_comprehension, user_view_count)
+        rank, size = self._rank_from_score(score)
+        inputs = self._personalized_inputs(
+            {"engagement_score": score, "avg_comprehension": user_comprehension},
+            {"preferred_difficulty": self.rank_shapes[rank]},
+            size,
+        )
+        inputs["genre"] = genre
+        key = cache_key('advanced', FISH_RENDER_VERSION, inputs, output_format)
+        return self.cache.get_or_create(
+            key, lambda: self._render_jobs([('personalized', inputs, output_format)])[0]
+        )
     
     def generate_simple_fish(self, title: str, size: tuple = (100, 60)) -> str:
         """シンプルな魚画像を生成（従来互換）"""
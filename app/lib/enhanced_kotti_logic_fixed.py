@@ -18,6 +18,10 @@ except ImportError:
         return None
 
 from datetime import datetime, timedelta
+from typing import Iterable, List
+
+# ユーザー学習統計のキャッシュ時間（秒）。水槽の再描画ごとに問い合わせないようにする
+USER_STATS_TTL_SECONDS = 300
 
 
 def get_enhanced_kotti_state(user_id: str, video_id: Optional[int], base_stage: int = 1) -> Dict[str, Any]:
@@ -32,75 +36,105 @@ def get_enhanced_kotti_state(user_id: str, video_id: Optional[int], base_stage:
     Returns:
         こってぃくんの状態辞書（stage, special_effects, bonus_size, achievements）
     """
+    states = get_enhanced_kotti_states(user_id, [video_id], {video_id: base_stage})
+    return states[video_id]
+
+
+def get_enhanced_kotti_states(user_id: str, video_ids: Iterable[Optional[int]],
+                              base_stages: Optional[Dict[int, int]] = None) -> Dict[Optional[int], Dict[str, Any]]:
+    """
+    水槽の全ての魚についてこってぃくんの状態をまとめて決定
+
+    ユーザー単位の部分（特殊効果・サイズボーナス・実績）は1回だけ計算し、
+    動画進度は1回の in_() クエリでまとめて取得する。
+
+    Args:
+        user_id: ユーザーID
+        video_ids: 動画IDのリスト
+        base_stages: 動画ID → 基本段階（省略時は1）
+
+    Returns:
+        動画ID → こってぃくんの状態辞書（get_enhanced_kotti_state と同じ形式 + video_progress）
+    """
+    base_stages = base_stages or {}
+    ids = list(dict.fromkeys(video_ids))
     try:
         supabase = get_supabase_client()
         if not supabase:
-            return {'stage': base_stage, 'special_effects': None, 'bonus_size': 1.0, 'achievements': []}
+            return {vid: {'stage': base_stages.get(vid, 1), 'special_effects': None,
+                          'bonus_size': 1.0, 'achievements': []} for vid in ids}
 
-        # ユーザー学習統計を取得
+        # ユーザー単位の計算（TTL付きキャッシュ）
         user_stats = get_user_learning_stats(user_id)
-        
-        # 動画進度情報を取得（任意）
-        video_history = []
-        if video_id:
-            try:
-                video_response = supabase.table('user_video_progress').select('*') \
-                    .eq('user_id', user_id) \
-                    .eq('video_id', video_id) \
-                    .execute()
-                video_history = video_response.data if video_response.data else []
-            except Exception:
-                video_history = []
-
-        # 各種ボーナス計算
-        level_bonus = calculate_level_bonus(user_stats)
-        
-        # 連続学習ボーナス
-        streak_bonus = calculate_streak_bonus(user_stats.get('learning_streak', 0))
-        
-        # 理解度ボーナス
-        comprehension_bonus = calculate_comprehension_bonus(
-            user_stats.get('avg_comprehension_score', 0)
-        )
-        
-        # 健康度ベースの段階は変更せず、特殊効果・サイズのみ拡張
-        # （健康度はforgetting.pyで科学的に計算されているため、それを尊重）
-        enhanced_stage = base_stage  # 健康度ベースのstageを維持
-        
-        # 特殊エフェクト決定
-        special_effects = determine_special_effects(user_stats, enhanced_stage)
-        
-        # サイズボーナス決定
-        size_bonus = calculate_size_bonus(user_stats, enhanced_stage)
-        
-        # 実績取得
+        special_effects = determine_special_effects(user_stats, 1)
+        size_bonus = calculate_size_bonus(user_stats, 1)
         achievements = get_user_achievements(user_stats)
-        
+
+        # 動画進度情報を一括取得
+        progress = get_video_progress_bulk(user_id, [vid for vid in ids if vid])
+
         return {
-            'stage': enhanced_stage,
-            'special_effects': special_effects,
-            'bonus_size': size_bonus,
-            'achievements': achievements
+            vid: {
+                'stage': base_stages.get(vid, 1),  # 健康度ベースのstageを維持
+                'special_effects': special_effects,
+                'bonus_size': size_bonus,
+                'achievements': achievements,
+                'video_progress': progress.get(vid, []),
+            }
+            for vid in ids
         }
-        
+
     except Exception as e:
         st.warning(f"Supabase連動エラー: {e}")
-        return {'stage': base_stage, 'special_effects': None, 'bonus_size': 1.0, 'achievements': []}
+        return {vid: {'stage': base_stages.get(vid, 1), 'special_effects': None,
+                      'bonus_size': 1.0, 'achievements': []} for vid in ids}
 
 
-def get_user_learning_stats(user_id: str) -> Dict[str, Any]:
-    """ユーザーの学習統計を取得"""
+def get_video_progress_bulk(user_id: str, video_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """複数動画の進度情報を1回のクエリで取得（動画ID → 進度レコードのリスト）"""
+    if not video_ids:
+        return {}
     try:
         supabase = get_supabase_client()
         if not supabase:
             return {}
-            
-        response = supabase.table('user_learning_stats').select('*') \
+
+        response = supabase.table('user_video_progress').select('*') \
             .eq('user_id', user_id) \
-            .single() \
+            .in_('video_id', sorted(set(video_ids))) \
             .execute()
-        
-        return response.data if response.data else {}
+
+        progress: Dict[int, List[Dict[str, Any]]] = {}
+        for record in response.data or []:
+            try:
+                vid = int(record.get('video_id'))
+            except (TypeError, ValueError):
+                continue
+            progress.setdefault(vid, []).append(record)
+        return progress
+    except Exception:
+        return {}
+
+
+@st.cache_data(ttl=USER_STATS_TTL_SECONDS, show_spinner=False)
+def _fetch_user_learning_stats(user_id: str) -> Dict[str, Any]:
+    """user_learning_stats を取得（ユーザーごとに TTL 付きでキャッシュ。エラーはキャッシュしない）"""
+    supabase = get_supabase_client()
+    if not supabase:
+        return {}
+
+    response = supabase.table('user_learning_stats').select('*') \
+        .eq('user_id', user_id) \
+        .single() \
+        .execute()
+
+    return response.data if response.data else {}
+
+
+def get_user_learning_stats(user_id: str) -> Dict[str, Any]:
+    """ユーザーの学習統計を取得"""
+    try:
+        return _fetch_user_learning_stats(user_id)
     except Exception:
         return {}
 
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+視聴ログからの魚の状態の導出（イベントソーシング）
+魚の状態は「動画登録時の初期状態 + 視聴（復習）イベントの畳み込み + 減衰」で決まる。
+数イベント・数日ごとにスナップショットを保存し、再計算は同じ減衰係数で保存した最新のスナップショット以降のイベントだけを畳み込む
+（減衰係数が変わった魚は登録時から畳み込み直す。減衰係数の推定は視聴のたびではなく refit_decay_rates で定期的に行う）
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import and_, or_, insert, update
+from sqlmodel import Session, select, func
+from .models import Fish, Video, View, FishSnapshot, FishDecayRate
+from .forgetting import LAMBDA, update_fish_states_batch, project_health
+from .decay_fit import fit_decay_rates, load_decay_rates
+
+# スナップショットを保存する間隔（前回のスナップショットからどちらかを超えたら保存）
+SNAPSHOT_EVERY_EVENTS = 5
+SNAPSHOT_EVERY_DAYS = 7
+
+# スナップショットの減衰係数が評価する値と同じとみなす誤差
+LAMBDA_TOLERANCE = 1e-12
+
+# 動画登録時の魚の状態（main.py で作成する Fish と同じ）
+INITIAL_S = 0.7
+INITIAL_HEALTH = 50
+INITIAL_WEIGHT_G = 100
+
+
+@dataclass
+class FishState:
+    """視聴イベントを畳み込んだ魚の状態（last_update は最後のイベントの時刻）"""
+    fish_id: int
+    s: float
+    health: int
+    weight_g: int
+    status: str
+    last_update: datetime
+    next_due: Optional[datetime] = None
+    event_count: int = 0
+    last_view_id: int = 0
+    # 最後に保存したスナップショット（減衰係数によらない）のイベント数と時刻（無ければ 0 / None）。保存間隔の判定に使う
+    snapshot_event_count: int = 0
+    snapshot_at: Optional[datetime] = None
+
+
+def _initial_state(fish_id: int, created_at: datetime) -> FishState:
+    return FishState(fish_id, INITIAL_S, INITIAL_HEALTH, INITIAL_WEIGHT_G, 'alive', created_at)
+
+
+def _snapshot_state(snap: FishSnapshot) -> FishState:
+    return FishState(snap.fish_id, snap.s, snap.health, snap.weight_g, snap.status, snap.at, snap.next_due,
+                     snap.event_count, snap.last_view_id, snap.event_count, snap.at)
+
+
+def fold_events(states: List[FishState], events: List[List[Tuple[int, datetime]]], lam=LAMBDA) -> List[FishState]:
+    """
+    各魚の状態に視聴イベントを時刻順に畳み込む
+
+    どの視聴も復習（update_fish_state(reviewed_today=True)）として扱い、
+    j 番目のイベントを持つ魚をまとめて update_fish_states_batch で1回に計算する（ループはイベント数の最大値だけ）。
+    体重はイベントの間に日付が変わるごとに -2（毎日1回自然減衰を適用した場合と同じ）。
+
+    Args:
+        states: 魚ごとの開始状態
+        events: 魚ごとの [(視聴ID, 視聴時刻), ...]（時刻順）
+        lam: 減衰係数（スカラーまたは魚ごとの配列）
+
+    Returns:
+        list: 畳み込み後の状態（states と同じ順）
+    """
+    n = len(states)
+    s = np.array([st.s for st in states], dtype=float)
+    health = np.array([st.health for st in states], dtype=int)
+    weight = np.array([st.weight_g for st in states], dtype=float)
+    status = np.array([st.status for st in states], dtype=object)
+    last = np.array([st.last_update for st in states], dtype='datetime64[us]')
+    next_due = np.array([st.next_due for st in states], dtype='datetime64[us]')
+    count = np.array([st.event_count for st in states], dtype=int)
+    last_view = np.array([st.last_view_id for st in states], dtype=int)
+    lam = np.broadcast_to(np.asarray(lam, dtype=float), (n,))
+
+    depth = max((len(ev) for ev in events), default=0)
+    for j in range(depth):
+        idx = np.array([i for i, ev in enumerate(events) if len(ev) > j], dtype=int)
+        view_ids = np.array([events[i][j][0] for i in idx], dtype=int)
+        times = np.array([events[i][j][1] for i in idx], dtype='datetime64[us]')
+
+        days = (times.astype('datetime64[D]') - last[idx].astype('datetime64[D]')).astype(int)
+        decayed_weight = np.maximum(50, weight[idx] - 2 * np.maximum(days, 0))
+        result = update_fish_states_batch(s[idx], last[idx], decayed_weight, count[idx] + 1, times,
+                                          reviewed_today=True, lam=lam[idx])
+        s[idx] = result['s']
+        health[idx] = result['health']
+        weight[idx] = result['weight_g']
+        status[idx] = result['status']
+        next_due[idx] = result['next_due']
+        last[idx] = times
+        count[idx] += 1
+        last_view[idx] = view_ids
+
+    return [
+        FishState(st.fish_id, float(s[i]), int(health[i]), int(weight[i]), str(status[i]),
+                  last[i].item(), None if np.isnat(next_due[i]) else next_due[i].item(),
+                  int(count[i]), int(last_view[i]), st.snapshot_event_count, st.snapshot_at)
+        for i, st in enumerate(states)
+    ]
+
+
+def _latest_snapshot_ids(fish_ids: Optional[List[int]], until: Optional[datetime], lam: Optional[float],
+                         match_lam: bool = True):
+    """
+    魚ごとの最新（until 以前）のスナップショット ID を返すサブクエリ
+
+    スナップショットはその時点の減衰係数で畳み込んだ結果なので、評価する減衰係数（lam。None なら
+    decay_fit の推定値、未推定の魚は LAMBDA）と同じ値で保存されたものだけを使う。
+    一致するものが無い魚は登録時の状態から畳み込み直す。match_lam=False なら減衰係数によらず最新のもの。
+    """
+    stmt = select(func.max(FishSnapshot.id)).group_by(FishSnapshot.fish_id)
+    if match_lam:
+        if lam is None:
+            target = func.coalesce(FishDecayRate.lam, LAMBDA)
+            stmt = stmt.outerjoin(FishDecayRate, FishDecayRate.fish_id == FishSnapshot.fish_id)
+        else:
+            target = float(lam)
+        stmt = stmt.where(func.abs(FishSnapshot.lam - target) <= LAMBDA_TOLERANCE)
+    if fish_ids is not None:
+        stmt = stmt.where(FishSnapshot.fish_id.in_(fish_ids))
+    if until is not None:
+        stmt = stmt.where(FishSnapshot.at <= until)
+    return stmt
+
+
+def derive_states(ses: Session, fish_ids: Optional[Iterable[int]] = None,
+                  until: Optional[datetime] = None, lam: Optional[float] = None) -> Dict[int, FishState]:
+    """
+    評価する減衰係数で保存した最新のスナップショット以降の視聴だけを畳み込んで魚の状態を求める（DB は変更しない）
+    そのようなスナップショットが無い魚は登録時から全ての視聴を畳み込む。
+
+    Args:
+        ses: データベースセッション
+        fish_ids: 対象の魚ID（None なら全ての魚）
+        until: この時刻までの視聴で求める（過去の状態の再現。None なら全ての視聴）
+        lam: 減衰係数の what-if 値（None なら decay_fit の推定値、未推定の魚は LAMBDA）
+
+    Returns:
+        dict: 魚ID → FishState
+    """
+    fish_ids = list(fish_ids) if fish_ids is not None else None
+    fish_stmt = select(Fish.id, Video.created_at).join(Video, Video.id == Fish.video_id).order_by(Fish.id)
+    if fish_ids is not None:
+        fish_stmt = fish_stmt.where(Fish.id.in_(fish_ids))
+    created = dict(ses.exec(fish_stmt).all())
+    if not created:
+        return {}
+
+    latest = _latest_snapshot_ids(fish_ids, until, lam)
+    snaps = {snap.fish_id: snap for snap in ses.exec(select(FishSnapshot).where(FishSnapshot.id.in_(latest))).all()}
+
+    # スナップショットより後の視聴（(時刻, ID) の順で比較）だけを魚ごとに時刻順で取得
+    snap = select(FishSnapshot).where(FishSnapshot.id.in_(latest)).subquery()
+    event_stmt = (
+        select(Fish.id, View.id, View.viewed_at)
+        .join(View, View.video_id == Fish.video_id)
+        .outerjoin(snap, snap.c.fish_id == Fish.id)
+        .where(or_(snap.c.id.is_(None), View.viewed_at > snap.c.at,
+                   and_(View.viewed_at == snap.c.at, View.id > snap.c.last_view_id)))
+        .order_by(Fish.id, View.viewed_at, View.id)
+    )
+    if fish_ids is not None:
+        event_stmt = event_stmt.where(Fish.id.in_(fish_ids))
+    if until is not None:
+        event_stmt = event_stmt.where(View.viewed_at <= until)
+    events: Dict[int, List[Tuple[int, datetime]]] = {fish_id: [] for fish_id in created}
+    for fish_id, view_id, viewed_at in ses.exec(event_stmt).all():
+        events[fish_id].append((view_id, viewed_at))
+
+    # 保存間隔は減衰係数によらず最後に保存したスナップショットから数える
+    # （推定値が変わって登録時から畳み込み直しただけでは、新しいスナップショットを保存しない）
+    last_saved = _latest_snapshot_ids(fish_ids, until, lam, match_lam=False)
+    saved = {fish_id: (count, at) for fish_id, count, at in ses.exec(
+        select(FishSnapshot.fish_id, FishSnapshot.event_count, FishSnapshot.at)
+        .where(FishSnapshot.id.in_(last_saved))).all()}
+
+    ids = list(created)
+    states = [_snapshot_state(snaps[i]) if i in snaps else _initial_state(i, created[i]) for i in ids]
+    for st in states:
+        if st.fish_id in saved:
+            st.snapshot_event_count, st.snapshot_at = saved[st.fish_id]
+    if lam is None:
+        rates = load_decay_rates(ses, ids)
+        lam = [rates.get(i, LAMBDA) for i in ids]
+    folded = fold_events(states, [events[i] for i in ids], lam)
+    return dict(zip(ids, folded))
+
+
+def fish_health_at(ses: Session, fish_id: int, when: datetime, lam: Optional[float] = None) -> Optional[int]:
+    """ある時刻の魚の健康度を視聴ログから再現（復習していない間は減衰で求める）"""
+    state = derive_states(ses, [fish_id], until=when, lam=lam).get(fish_id)
+    if state is None:
+        return None
+    if lam is None:
+        lam = load_decay_rates(ses, [fish_id]).get(fish_id, LAMBDA)
+    return int(project_health([state.s], [state.last_update], [state.event_count], [when], lam)[0, 0])
+
+
+def apply_state(fish: Fish, state: FishState) -> Fish:
+    """導出した状態を Fish の行に書き込む（Fish は導出結果のキャッシュ）"""
+    fish.s = state.s
+    fish.health = state.health
+    fish.weight_g = state.weight_g
+    fish.status = state.status
+    fish.last_update = state.last_update
+    fish.next_due = state.next_due
+    return fish
+
+
+def _needs_snapshot(state: FishState) -> bool:
+    if state.event_count == state.snapshot_event_count:
+        return False
+    if state.snapshot_at is None or state.event_count - state.snapshot_event_count >= SNAPSHOT_EVERY_EVENTS:
+        return True
+    return state.last_update - state.snapshot_at >= timedelta(days=SNAPSHOT_EVERY_DAYS)
+
+
+def _snapshot_params(state: FishState, lam: float) -> dict:
+    return {
+        'fish_id': state.fish_id,
+        'event_count': state.event_count,
+        'last_view_id': state.last_view_id,
+        'at': state.last_update,
+        's': state.s,
+        'health': state.health,
+        'weight_g': state.weight_g,
+        'status': state.status,
+        'next_due': state.next_due,
+        'lam': lam,
+        'created_at': datetime.utcnow(),
+    }
+
+
+def record_view_event(ses: Session, fish: Fish) -> FishState:
+    """
+    視聴を記録した後に呼ぶ: 魚の状態を視聴ログから導出して Fish に書き込み、必要ならスナップショットを保存
+
+    畳み込むのは同じ減衰係数で保存した最新のスナップショット以降の視聴だけ。
+    減衰係数は視聴のたびには推定し直さない（refit_decay_rates で定期的に推定する）ので、通常はスナップショットの続きから畳み込む。
+    スナップショットは1行の INSERT なので、視聴のたびに呼んでも軽い。commit は呼び出し側で行う。
+    """
+    ses.flush()  # 記録したばかりの視聴を集計に含める
+    state = derive_states(ses, [fish.id])[fish.id]
+    apply_state(fish, state)
+    if _needs_snapshot(state):
+        lam = load_decay_rates(ses, [fish.id]).get(fish.id, LAMBDA)
+        ses.exec(insert(FishSnapshot), params=[_snapshot_params(state, lam)])
+    return state
+
+
+def recompute_all(ses: Session, lam: Optional[float] = None, persist: bool = True,
+                  fish_ids: Optional[Iterable[int]] = None) -> Dict[int, FishState]:
+    """
+    全ての魚の状態を視聴ログから再計算（モデル変更後の再計算・what-if 評価）
+
+    lam と同じ減衰係数で保存したスナップショットがある魚はその続きから、無い魚は登録時から畳み込む
+    （減衰係数を変えた直後の再計算は全ての視聴を畳み込み直す）。persist=False なら DB は変更しない。
+
+    Args:
+        ses: データベースセッション（commit は呼び出し側で行う）
+        lam: 減衰係数の what-if 値（None なら推定値・LAMBDA）
+        persist: True なら Fish に書き戻し、間隔を超えた魚のスナップショットを保存する
+        fish_ids: 対象の魚ID（None なら全ての魚）
+
+    Returns:
+        dict: 魚ID → FishState
+    """
+    states = derive_states(ses, fish_ids, lam=lam)
+    if persist and states:
+        rows = [
+            {'id': st.fish_id, 's': st.s, 'health': st.health, 'weight_g': st.weight_g, 'status': st.status,
+             'last_update': st.last_update, 'next_due': st.next_due}
+            for st in states.values() if st.event_count > 0
+        ]
+        if rows:
+            # 主キー指定の bulk UPDATE（視聴の無い魚は登録時の状態のまま）
+            ses.exec(update(Fish), params=rows)
+        rates = load_decay_rates(ses, list(states)) if lam is None else {}
+        snapshots = [_snapshot_params(st, lam if lam is not None else rates.get(st.fish_id, LAMBDA))
+                     for st in states.values() if _needs_snapshot(st)]
+        if snapshots:
+            ses.exec(insert(FishSnapshot), params=snapshots)
+    return states
+
+
+def refit_decay_rates(ses: Session, now: Optional[datetime] = None) -> int:
+    """
+    全ての魚の減衰係数をまとめて推定し直し、推定値が変わった魚の状態を視聴ログから導出し直す（定期ジョブ）
+
+    推定値が変わった魚はそれまでのスナップショットが使えなくなるので、視聴のたびではなく
+    decay_fit.DECAY_FIT_INTERVAL ごとにまとめて行う（前回から視聴の無い魚は同じ値になり、そのまま使える）。
+
+    Args:
+        ses: データベースセッション（commit は呼び出し側で行う）
+        now: 推定日時
+
+    Returns:
+        int: 推定値が変わった魚の数
+    """
+    before = dict(ses.exec(select(FishDecayRate.fish_id, FishDecayRate.lam)).all())
+    fit_decay_rates(ses, now=now)
+    after = dict(ses.exec(select(FishDecayRate.fish_id, FishDecayRate.lam)).all())
+    changed = [fish_id for fish_id, lam in after.items()
+               if abs(lam - before.get(fish_id, LAMBDA)) > LAMBDA_TOLERANCE]
+    if changed:
+        recompute_all(ses, fish_ids=changed)
+    return len(changed)
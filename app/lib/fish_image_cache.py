@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+生成した魚画像のキャッシュ
+入力パラメータのハッシュをキーに、メモリ上の LRU とディスク上のストアの2段で保持する
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+# ディスクキャッシュの保存先と上限サイズ
+FISH_CACHE_DIR = os.getenv("FISH_IMAGE_CACHE_DIR", "./.fish_cache")
+FISH_CACHE_MAX_BYTES = int(os.getenv("FISH_IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+FISH_CACHE_MEMORY_ITEMS = 512
+
+
+def cache_key(*parts: Any) -> str:
+    """入力パラメータから安定したキー（SHA-256）を作成"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class FishImageCache:
+    """メモリ LRU + ディスクストアの2段キャッシュ（値は base64 文字列など任意の str）"""
+
+    def __init__(self, cache_dir: Optional[str] = FISH_CACHE_DIR,
+                 max_disk_bytes: int = FISH_CACHE_MAX_BYTES,
+                 memory_items: int = FISH_CACHE_MEMORY_ITEMS):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+
+    # ---- メモリ LRU ----
+    def _remember(self, key: str, value: str):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # ---- ディスクストア ----
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = f.read()
+            os.utime(path)  # 最終利用時刻を更新（追い出し順に使う）
+            return value
+        except OSError:
+            return None
+
+    def _write_disk(self, key: str, value: str):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"魚画像キャッシュ書き込みエラー: {e}")
+            return
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(value.encode('utf-8'))
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """ディスク使用量が上限を超えていれば、古いものから上限の90%まで削除"""
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_disk_bytes * 0.9)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._disk_bytes = total
+
+    # ---- 公開 API ----
+    def get(self, key: str) -> Optional[str]:
+        """キャッシュから取得（メモリ → ディスクの順に探す）"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                return value
+        value = self._read_disk(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: str):
+        """キャッシュに保存"""
+        self._remember(key, value)
+        self._write_disk(key, value)
+
+    def get_or_create(self, key: str, factory: Callable[[], Optional[str]]) -> Optional[str]:
+        """キャッシュにあればそれを返し、なければ factory で生成して保存（None は保存しない）"""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+
+_default_cache: Optional[FishImageCache] = None
+_default_lock = threading.Lock()
+
+
+def get_fish_image_cache() -> FishImageCache:
+    """プロセス共通のキャッシュを取得"""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = FishImageCache()
+        return _default_cache
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+魚画像の事前生成（ライトスルー）
+動画登録で学習データが変わった時点で画像を作ってキャッシュに書き込み、
+水槽の描画ではでき上がった画像を読むだけにする
+"""
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+
+def fish_image_specs(user_stats: Dict[str, Any], learning_patterns: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    水槽の魚画像の生成指定（個人化・進化・レアの3枚、AdvancedFishGenerator.generate_many 用）
+
+    生成器が見るのはユーザーの学習データだけ（動画タイトルや魚の記憶強度は画像に影響しない）なので、
+    指定にもそれ以外は入れない。水槽の描画と事前生成で同じ指定を使うので、事前生成した画像がそのままキャッシュに当たる。
+    """
+    return [
+        {"kind": "personalized", "user_stats": user_stats, "user_patterns": learning_patterns},
+        {"kind": "evolution", "new_stats": user_stats},
+        {"kind": "rare", "achievement_type": "streak"},
+    ]
+
+
+def pregenerate_fish_images(user_id: Optional[str]) -> int:
+    """
+    水槽の魚画像を生成してキャッシュに書き込む
+
+    高度な魚はログイン中のユーザーの学習データから作るので、user_id が無ければ何もしない。
+    学習データが変わるのは動画登録（学習ログの保存）のときなので、その後に呼ぶ。
+    失敗しても登録処理は止めない（水槽の描画時にキャッシュにない分が生成される）。
+
+    Args:
+        user_id: ログイン中のユーザー ID
+
+    Returns:
+        int: 書き込んだ画像の枚数（スキップ・失敗時は 0）
+    """
+    if not user_id:
+        return 0
+    try:
+        from .dynamic_fish_generator import AdvancedFishGenerator
+        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if project_root not in sys.path:
+            sys.path.append(project_root)
+        from repositories.supabase_repo import get_user_stats, get_user_learning_patterns
+
+        specs = fish_image_specs(get_user_stats(user_id), get_user_learning_patterns(user_id))
+        images = AdvancedFishGenerator().generate_many(specs)
+        return sum(1 for image in images if image)
+    except Exception as e:
+        print(f"魚画像の事前生成エラー: {e}")
+        return 0
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+魚ランキング用のパーセンタイル索引
+エンゲージメントスコアをソート済み配列で保持し、順位・パーセンタイルを二分探索で求める
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# パーセンタイル（上位何%か）の上限 → 称号（上から順に判定）
+RANK_TIERS = [(10, "マスター"), (25, "エキスパート"), (50, "上級者"), (75, "中級者")]
+DEFAULT_TIER = "初心者"
+
+
+def rank_tier(percentile: float) -> str:
+    """パーセンタイル（上位何%か）から称号を求める"""
+    for limit, tier in RANK_TIERS:
+        if percentile <= limit:
+            return tier
+    return DEFAULT_TIER
+
+
+def _score(stats: Dict[str, Any]) -> float:
+    return float(stats.get("engagement_score", 0.0) or 0.0)
+
+
+class FishRankIndex:
+    """
+    ユーザーのエンゲージメントスコアの順位索引
+
+    - 順位・パーセンタイルの参照: 二分探索で O(log n)
+    - 1人分のスコア更新: 二分探索で位置を求めて挿入・削除（比較は O(log n)、要素の移動は memmove）
+    - 全員の順位: 1回のソートと走査で O(n log n)
+
+    順位は「自分より高いスコアの人数 + 1」（同点は同順位、最下位は n を超えない）。
+    """
+
+    def __init__(self, scores: Optional[Dict[Hashable, float]] = None):
+        self._by_user: Dict[Hashable, float] = {}
+        self._sorted: List[float] = []  # 昇順
+        if scores:
+            self._by_user = {user: float(score) for user, score in scores.items()}
+            self._sorted = sorted(self._by_user.values())
+
+    @classmethod
+    def from_stats(cls, all_users_stats: Iterable[Dict[str, Any]],
+                   key: Optional[str] = "user_id") -> "FishRankIndex":
+        """
+        get_all_users_stats の結果から索引を作成
+
+        key の値をユーザーとして登録する（key が None か、値が無いものは並び順の番号で登録）。
+        """
+        return cls({(stats.get(key, i) if key else i): _score(stats)
+                    for i, stats in enumerate(all_users_stats)})
+
+    def __len__(self) -> int:
+        return len(self._sorted)
+
+    def __contains__(self, user: Hashable) -> bool:
+        return user in self._by_user
+
+    def update(self, user: Hashable, score: float):
+        """1人分のスコアを追加・更新"""
+        score = float(score)
+        old = self._by_user.get(user)
+        if old is not None:
+            if old == score:
+                return
+            del self._sorted[bisect_left(self._sorted, old)]
+        self._by_user[user] = score
+        insort(self._sorted, score)
+
+    def remove(self, user: Hashable):
+        """ユーザーを索引から削除"""
+        old = self._by_user.pop(user, None)
+        if old is not None:
+            del self._sorted[bisect_left(self._sorted, old)]
+
+    def rank_of_score(self, score: float) -> int:
+        """スコアの順位（1始まり）"""
+        n = len(self._sorted)
+        higher = n - bisect_right(self._sorted, float(score))
+        return max(1, min(higher + 1, n))
+
+    def percentile_of_score(self, score: float) -> float:
+        """スコアのパーセンタイル（上位何%か、0..100）"""
+        if not self._sorted:
+            return 100.0
+        return self.rank_of_score(score) / len(self._sorted) * 100
+
+    def rank_of_score_with_tier(self, score: float) -> Tuple[str, int]:
+        """スコアの (称号, 順位)。索引が空なら ("初心者", 1)"""
+        if not self._sorted:
+            return DEFAULT_TIER, 1
+        return rank_tier(self.percentile_of_score(score)), self.rank_of_score(score)
+
+    def rank(self, user: Hashable) -> Tuple[str, int]:
+        """登録済みユーザーの (称号, 順位)"""
+        return self.rank_of_score_with_tier(self._by_user[user])
+
+    def rank_all(self) -> Dict[Hashable, Tuple[str, int]]:
+        """
+        全員の (称号, 順位) をまとめて求める
+
+        スコアの高い順に1回走査し、同点は同順位にする（ユーザーごとの二分探索は不要）。
+        """
+        n = len(self._sorted)
+        ordered = sorted(self._by_user.items(), key=lambda item: item[1], reverse=True)
+        result: Dict[Hashable, Tuple[str, int]] = {}
+        rank = 0
+        prev = None
+        for i, (user, score) in enumerate(ordered):
+            if score != prev:
+                rank, prev = i + 1, score
+            result[user] = (rank_tier(rank / n * 100), rank)
+        return result
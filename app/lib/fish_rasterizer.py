@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+魚画像のバッチラスタライザ
+魚の形（胴体・尻尾・目・装飾）は ImageDraw でラベルマップ（画素ごとの図形番号）として描き、
+着色・明るさ・彩度は NumPy で全ての魚にまとめて掛ける（オーラのぼかしだけは PIL で1枚ずつ）
+（同じ形の魚はラベルマップを共有するので、図形を描くのは異なる形ごとに1回だけ）
+"""
+import io
+import base64
+from typing import List, Sequence, Tuple
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw, ImageFilter
+from . import fish_shapes as shapes_
+
+
+def to_rgba(color: str) -> Tuple[int, int, int, int]:
+    """'#RRGGBB' や 'white' などの色指定を RGBA タプルに変換"""
+    rgb = ImageColor.getrgb(color)
+    return rgb if len(rgb) == 4 else (*rgb, 255)
+
+
+def label_map(size: tuple, layers: Sequence[Tuple[int, str, list]]) -> np.ndarray:
+    """
+    図形を順に ImageDraw で描き、画素ごとに一番上の図形の番号を求める
+
+    Args:
+        size: キャンバスサイズ (幅, 高さ)
+        layers: (番号, 'ellipse' または 'polygon', 座標) のリスト（後のものが上、番号は 1..255）
+
+    Returns:
+        np.ndarray: (高さ, 幅) の uint8 ラベル（0 は透明）
+    """
+    image = Image.new('L', size, 0)
+    draw = ImageDraw.Draw(image)
+    for label, kind, coords in layers:
+        if kind == 'ellipse':
+            draw.ellipse(coords, fill=label)
+        else:
+            draw.polygon(coords, fill=label)
+    return np.asarray(image)
+
+
+def colorize(labels: np.ndarray, index: np.ndarray, palettes: np.ndarray) -> np.ndarray:
+    """
+    ラベルマップに魚ごとの色を付ける（1回の gather で全ての魚を着色）
+
+    Args:
+        labels: (U, 高さ, 幅) のラベルマップ
+        index: (N,) 各魚が使うラベルマップの番号
+        palettes: (N, レイヤー数 + 1, 4) の RGBA（0 番は透明）
+
+    Returns:
+        np.ndarray: (N, 高さ, 幅, 4) の uint8 RGBA 画像
+    """
+    n = len(index)
+    _, h, w = labels.shape
+    # RGBA を uint32 1つにまとめて引く
+    packed = np.ascontiguousarray(palettes, dtype=np.uint8).view(np.uint32)[..., 0]
+    return packed[np.arange(n)[:, None, None], labels[index]].view(np.uint8).reshape(n, h, w, 4)
+
+
+def adjust_colors(colors: np.ndarray, brightness=1.0, saturation=1.0) -> np.ndarray:
+    """
+    明るさ・彩度の補正を色にまとめて掛ける（ImageEnhance.Brightness → ImageEnhance.Color の順と同じ）
+
+    魚の画像は単色の塗りだけなので、画素ではなくパレットに掛ければ
+    着色（colorize）の gather がそのまま補正済みの最終画像になる。
+
+    Args:
+        colors: (..., 4) の uint8 RGBA
+        brightness: 明るさの倍率（colors.shape[:-1] にブロードキャスト）
+        saturation: 彩度の倍率（輝度との補間、1.0 でそのまま）
+
+    Returns:
+        np.ndarray: colors と同じ形の uint8 RGBA（アルファはそのまま）
+    """
+    colors = np.asarray(colors, dtype=np.uint8)
+    brightness = np.asarray(brightness, dtype=np.float32)[..., None]
+    saturation = np.asarray(saturation, dtype=np.float32)[..., None]
+    rgb = np.clip(colors[..., :3] * brightness, 0, 255).astype(np.uint8).astype(np.float32)
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    rgb = np.clip(luma[..., None] + (rgb - luma[..., None]) * saturation, 0, 255)
+    out = colors.copy()
+    out[..., :3] = rgb.astype(np.uint8)
+    return out
+
+
+def add_aura(images: np.ndarray) -> np.ndarray:
+    """
+    魚の輪郭の外側にぼかした光（オーラ）を付ける
+
+    ぼかした画像を下に敷いて元の画像を重ねる（ぼかしは乗算済みアルファの 'RGBa' で行うので、縁が黒ずまない）。
+    ぼかしは NumPy で畳み込むより PIL の GaussianBlur の方が速いので、1枚ずつ PIL で処理する。
+
+    Args:
+        images: (N, 高さ, 幅, 4) の uint8 RGBA
+
+    Returns:
+        np.ndarray: 同じ形の uint8 RGBA
+    """
+    out = np.empty_like(images)
+    for i, image in enumerate(images):
+        fish = Image.fromarray(image)
+        glow = fish.convert('RGBa').filter(ImageFilter.GaussianBlur(radius=1)).convert('RGBA')
+        out[i] = np.asarray(Image.alpha_composite(glow, fish))
+    return out
+
+
+def encode_png(image: np.ndarray) -> str:
+    """RGBA 配列を Base64 PNG に変換"""
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def _personalized_labels(size: tuple, bw: int, bh: int, eye: int, sharp: int, ornament: int) -> np.ndarray:
+    """個人化魚1つの形のラベルマップ（1: 胴体、2: 尻尾、3: 白目、4: 黒目、5: 装飾）"""
+    if sharp:
+        layers = [(1, 'polygon', shapes_.pentagon_points(size, bw, bh))]
+    else:
+        layers = [(1, 'ellipse', shapes_.body_box(size, bw, bh))]
+    white_box, pupil_box = shapes_.eye_boxes(size, bw, eye)
+    layers += [(2, 'polygon', shapes_.tail_points(size, bw, bh)),
+               (3, 'ellipse', white_box),
+               (4, 'ellipse', pupil_box)]
+    if ornament == shapes_.ORNAMENT_CROWN:
+        layers.append((5, 'polygon', shapes_.crown_points(size)))
+    elif ornament == shapes_.ORNAMENT_SPIKE:
+        layers.append((5, 'polygon', shapes_.spike_points(size)))
+    return label_map(size, layers)
+
+
+def rasterize_personalized(size: tuple, scales: Sequence[float], shapes: Sequence[int],
+                           comprehensions: Sequence[float], primary: np.ndarray,
+                           secondary: np.ndarray, accent: np.ndarray,
+                           brightness=1.0, saturation=1.0, aura=None) -> np.ndarray:
+    """
+    個人化された魚をまとめて描画
+
+    魚の形は整数の寸法（胴体の幅・高さ、目の大きさ）と形状・装飾の種類だけで決まるので、
+    異なる形ごとに1回だけラベルマップを作り、色付けは全ての魚で1回の gather で行う。
+    明るさ・彩度の補正はパレットに掛けておくので、gather の結果がそのまま最終画像になる。
+
+    Args:
+        size: キャンバスサイズ (幅, 高さ)（バッチ内で共通）
+        scales: エンゲージメントによる拡大率 (N,)
+        shapes: 形状コード SHAPE_* (N,)
+        comprehensions: 平均理解度 (N,)（装飾の種類を決める）
+        primary, secondary, accent: 胴体・尻尾・装飾の色 (N, 4)
+        brightness, saturation: 明るさ・彩度の倍率（スカラーまたは (N,)）
+        aura: (N,) の bool。True の魚にオーラ（add_aura）を付ける
+
+    Returns:
+        np.ndarray: (N, 高さ, 幅, 4) の uint8 RGBA 画像
+    """
+    n = len(scales)
+    w, h = size
+    if n == 0:
+        return np.empty((0, h, w, 4), dtype=np.uint8)
+
+    # 形を決める整数パラメータ（異なる組み合わせごとに1回だけ描く）
+    bw, bh, eye = shapes_.body_dimensions(size, scales)
+    sharp = (np.asarray(shapes) == shapes_.SHAPE_SHARP).astype(np.int64)
+    ornament = shapes_.ornament_kind(comprehensions)
+    geometry, index = np.unique(np.stack([bw, bh, eye, sharp, ornament], axis=1),
+                                axis=0, return_inverse=True)
+
+    labels = np.stack([_personalized_labels(size, *row) for row in geometry.tolist()])
+
+    palettes = np.zeros((n, 6, 4), dtype=np.uint8)
+    palettes[:, 1] = primary
+    palettes[:, 2] = secondary
+    palettes[:, 3] = to_rgba('white')
+    palettes[:, 4] = to_rgba('black')
+    palettes[:, 5] = accent
+    palettes = adjust_colors(palettes, np.broadcast_to(brightness, (n,))[:, None],
+                             np.broadcast_to(saturation, (n,))[:, None])
+    images = colorize(labels, index.reshape(-1), palettes)
+
+    # オーラはぼかしが必要なので、対象の魚だけ画素で処理する
+    if aura is not None:
+        aura = np.asarray(aura, dtype=bool)
+        if aura.any():
+            images[aura] = add_aura(images[aura])
+    return images
+
+
+def rasterize_rare(size: tuple, palettes: np.ndarray, brightness: float = 1.0) -> np.ndarray:
+    """
+    レア魚（多色の胴体・豪華な尻尾・特別な目）をまとめて描画
+
+    Args:
+        size: キャンバスサイズ (幅, 高さ)
+        palettes: (N, 3, 4) の色（胴体は外側から、尻尾は逆順に使う）
+        brightness: 明るさの倍率（パレットに掛ける）
+
+    Returns:
+        np.ndarray: (N, 高さ, 幅, 4) の uint8 RGBA 画像
+    """
+    palettes = np.asarray(palettes, dtype=np.uint8)
+    n = palettes.shape[0]
+    w, h = size
+    if n == 0:
+        return np.empty((0, h, w, 4), dtype=np.uint8)
+
+    # レア魚の形は全て共通なので、ラベルマップは1枚だけ作って色だけ変える
+    k = palettes.shape[1]
+    layers = [('ellipse', box) for box in shapes_.rare_body_boxes(size, k)]
+    layers += [('polygon', points) for points in shapes_.rare_tail_points(size, k)]
+    layers += [('ellipse', box) for box in shapes_.rare_eye_boxes(size)]
+    labels = label_map(size, [(i, kind, coords) for i, (kind, coords) in enumerate(layers, start=1)])
+
+    colors = np.zeros((n, 2 * k + 4, 4), dtype=np.uint8)
+    colors[:, 1:k + 1] = palettes                # 胴体は外側から
+    colors[:, k + 1:2 * k + 1] = palettes[:, ::-1]  # 尻尾は逆順
+    colors[:, 2 * k + 1] = to_rgba('white')
+    colors[:, 2 * k + 2] = to_rgba('black')
+    colors[:, 2 * k + 3] = to_rgba('white')
+    colors = adjust_colors(colors, brightness)
+    return colorize(labels[None], np.zeros(n, dtype=np.int64), colors)
+
+
+def encode_batch(images: np.ndarray) -> List[str]:
+    """(N, 高さ, 幅, 4) の画像をそれぞれ Base64 PNG に変換"""
+    return [encode_png(img) for img in images]
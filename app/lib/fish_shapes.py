@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+魚の形の定義
+ラスタ版（fish_rasterizer）と SVG 版（fish_svg）で同じ寸法・座標を使うための共通部品
+（引数は int でも NumPy 配列でもよい）
+"""
+import numpy as np
+
+# 形状コード（preferred_difficulty → 胴体の形）
+SHAPE_ROUND = 0   # easy: 丸い
+SHAPE_NORMAL = 1  # medium: 標準
+SHAPE_SHARP = 2   # hard: 鋭い（多角形）
+
+# 装飾の種類（平均理解度 → 頭の飾り）
+ORNAMENT_NONE = 0
+ORNAMENT_SPIKE = 1  # 2.0以上: シンプルな角
+ORNAMENT_CROWN = 2  # 2.5以上: 王冠
+
+# レア魚のキャンバスサイズ（大きめ）
+RARE_SIZE = (150, 100)
+
+
+def body_dimensions(size: tuple, scales):
+    """エンゲージメントによる拡大率から胴体の幅・高さと目の大きさ（整数）を求める"""
+    w, h = size
+    scales = np.asarray(scales, dtype=np.float64)
+    bw = np.floor(w * 0.4 * scales).astype(np.int64)
+    bh = np.floor(h * 0.6 * scales).astype(np.int64)
+    eye = np.maximum(4, np.floor(8 * scales).astype(np.int64))
+    return bw, bh, eye
+
+
+def ornament_kind(comprehensions):
+    """平均理解度から装飾の種類を求める"""
+    comprehensions = np.asarray(comprehensions, dtype=np.float64)
+    return np.where(comprehensions >= 2.5, ORNAMENT_CROWN,
+                    np.where(comprehensions >= 2.0, ORNAMENT_SPIKE, ORNAMENT_NONE))
+
+
+def body_box(size: tuple, bw, bh) -> list:
+    """丸・標準の胴体（楕円）の外接矩形 [x0, y0, x1, y1]"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [cx - bw, cy - bh // 2, cx + bw // 2, cy + bh // 2]
+
+
+def pentagon_points(size: tuple, bw, bh) -> list:
+    """鋭い胴体（五角形）の頂点"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [
+        (cx - bw, cy),
+        (cx - bw // 2, cy - bh // 2),
+        (cx + bw // 2, cy - bh // 3),
+        (cx + bw // 2, cy + bh // 3),
+        (cx - bw // 2, cy + bh // 2),
+    ]
+
+
+def tail_points(size: tuple, bw, bh) -> list:
+    """尻尾（三角形）の頂点"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [(cx + bw // 2, cy - bh // 4), (cx + bw, cy), (cx + bw // 2, cy + bh // 4)]
+
+
+def eye_boxes(size: tuple, bw, eye) -> tuple:
+    """白目と黒目の外接矩形"""
+    cx, cy = size[0] // 2, size[1] // 2
+    ex = cx - bw // 2
+    white = [ex - eye, cy - eye // 2, ex + eye, cy + eye // 2]
+    pupil = [ex - eye // 2, cy - eye // 4, ex + eye // 2, cy + eye // 4]
+    return white, pupil
+
+
+def crown_points(size: tuple) -> list:
+    """王冠のような装飾（魚の大きさによらずキャンバス基準）"""
+    w, h = size
+    cx = w // 2
+    return [(cx - 15, h // 4), (cx - 10, h // 6), (cx - 5, h // 4 - 2), (cx, h // 6 - 3),
+            (cx + 5, h // 4 - 2), (cx + 10, h // 6), (cx + 15, h // 4)]
+
+
+def spike_points(size: tuple) -> list:
+    """シンプルな装飾"""
+    w, h = size
+    cx = w // 2
+    return [(cx - 8, h // 4), (cx, h // 6), (cx + 8, h // 4)]
+
+
+def rare_body_boxes(size: tuple, layers: int) -> list:
+    """レア魚の多色の胴体（外側から内側へ）"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [[cx - 50 + i * 3, cy - 25 + i * 3, cx + 30 - i * 3, cy + 25 - i * 3] for i in range(layers)]
+
+
+def rare_tail_points(size: tuple, layers: int) -> list:
+    """レア魚の豪華な尻尾（重ねる順）"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [[(cx + 30 - i * 2, cy - 15 + i * 2), (cx + 60 + i * 5, cy), (cx + 30 - i * 2, cy + 15 - i * 2)]
+            for i in range(layers)]
+
+
+def rare_eye_boxes(size: tuple) -> list:
+    """レア魚の特別な目（白目・黒目・ハイライト）"""
+    cx, cy = size[0] // 2, size[1] // 2
+    return [
+        [cx - 35, cy - 8, cx - 20, cy + 8],
+        [cx - 32, cy - 5, cx - 23, cy + 5],
+        [cx - 29, cy - 2, cx - 26, cy + 2],
+    ]
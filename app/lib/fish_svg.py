@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+魚画像の SVG 出力
+ラスタ版と同じ形の定義（fish_shapes）から小さな SVG 文書を組み立てる
+（ラスタライズも PNG 圧縮もしないので、生成が速くデータも小さい）
+"""
+from typing import List, Sequence
+from urllib.parse import quote
+import numpy as np
+from . import fish_shapes as shapes_
+from .fish_rasterizer import to_rgba, adjust_colors
+
+
+def _num(v) -> str:
+    """座標を短く書く（整数なら小数点なし）"""
+    v = float(v)
+    return str(int(v)) if v.is_integer() else f"{v:g}"
+
+
+def _hex(color) -> str:
+    """色指定（'#RRGGBB'・'white'・RGBA タプル）を '#rrggbb' に"""
+    r, g, b, _ = to_rgba(color) if isinstance(color, str) else color
+    return f"#{int(r):02x}{int(g):02x}{int(b):02x}"
+
+
+def _ellipse(box: Sequence, fill: str) -> str:
+    # ImageDraw.ellipse / fish_rasterizer と同じく外接矩形の両端の画素を含む
+    x0, y0, x1, y1 = (int(v) for v in box)
+    return (f'<ellipse cx="{_num((x0 + x1 + 1) / 2)}" cy="{_num((y0 + y1 + 1) / 2)}" '
+            f'rx="{_num((x1 - x0 + 1) / 2)}" ry="{_num((y1 - y0 + 1) / 2)}" fill="{fill}"/>')
+
+
+def _polygon(points: Sequence, fill: str) -> str:
+    coords = " ".join(f"{int(x)},{int(y)}" for x, y in points)
+    return f'<polygon points="{coords}" fill="{fill}"/>'
+
+
+def _document(size: tuple, elements: List[str], aura: bool = False) -> str:
+    w, h = size
+    body = "".join(elements)
+    if aura:
+        # ラスタ版の add_aura と同じく、ぼかした魚を下に敷いて元の魚を重ねる
+        body = ('<defs><filter id="a" x="-10%" y="-10%" width="120%" height="120%">'
+                '<feGaussianBlur stdDeviation="1"/></filter></defs>'
+                f'<use href="#f" filter="url(#a)"/><g id="f">{body}</g>')
+    return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{w}" height="{h}" '
+            f'viewBox="0 0 {w} {h}">{body}</svg>')
+
+
+def _adjusted(colors: Sequence, brightness: float, saturation: float = 1.0) -> List[str]:
+    """色指定に明るさ・彩度の補正を掛けて '#rrggbb' に（ラスタ版と同じ adjust_colors を使う）"""
+    rgba = adjust_colors(np.array([to_rgba(c) for c in colors], dtype=np.uint8), brightness, saturation)
+    return [_hex(c) for c in rgba]
+
+
+def personalized_svg(size: tuple, scale: float, shape: int, comprehension: float,
+                     primary: str, secondary: str, accent: str,
+                     brightness: float = 1.0, saturation: float = 1.0, aura: bool = False) -> str:
+    """
+    個人化された魚の SVG を作成（fish_rasterizer.rasterize_personalized と同じ形）
+
+    Args:
+        size: キャンバスサイズ (幅, 高さ)
+        scale: エンゲージメントによる拡大率
+        shape: 形状コード fish_shapes.SHAPE_*
+        comprehension: 平均理解度（装飾の種類を決める）
+        primary, secondary, accent: 胴体・尻尾・装飾の色
+        brightness, saturation: 明るさ・彩度の倍率（色に直接掛ける）
+        aura: True ならぼかしフィルタでオーラを付ける
+
+    Returns:
+        str: SVG 文書
+    """
+    primary, secondary, accent, white, black = _adjusted(
+        [primary, secondary, accent, 'white', 'black'], brightness, saturation)
+    bw, bh, eye = (int(v) for v in shapes_.body_dimensions(size, scale))
+    if shape == shapes_.SHAPE_SHARP:
+        body = _polygon(shapes_.pentagon_points(size, bw, bh), primary)
+    else:
+        body = _ellipse(shapes_.body_box(size, bw, bh), primary)
+    white_box, pupil_box = shapes_.eye_boxes(size, bw, eye)
+    elements = [
+        body,
+        _polygon(shapes_.tail_points(size, bw, bh), secondary),
+        _ellipse(white_box, white),
+        _ellipse(pupil_box, black),
+    ]
+    ornament = int(shapes_.ornament_kind(comprehension))
+    if ornament == shapes_.ORNAMENT_CROWN:
+        elements.append(_polygon(shapes_.crown_points(size), accent))
+    elif ornament == shapes_.ORNAMENT_SPIKE:
+        elements.append(_polygon(shapes_.spike_points(size), accent))
+    return _document(size, elements, aura)
+
+
+def rare_svg(colors: Sequence[str], brightness: float = 1.0) -> str:
+    """
+    レア魚の SVG を作成（fish_rasterizer.rasterize_rare と同じ形）
+
+    Args:
+        colors: 胴体の色（外側から。尻尾は逆順に使う）
+        brightness: 明るさの倍率（ラスタ版と同じく色に直接掛ける）
+
+    Returns:
+        str: SVG 文書
+    """
+    size = shapes_.RARE_SIZE
+    *fills, white, black = _adjusted(list(colors) + ['white', 'black'], brightness)
+    elements = [_ellipse(box, c) for box, c in zip(shapes_.rare_body_boxes(size, len(fills)), fills)]
+    elements += [_polygon(points, c)
+                 for points, c in zip(shapes_.rare_tail_points(size, len(fills)), fills[::-1])]
+    eye_white, pupil, highlight = shapes_.rare_eye_boxes(size)
+    elements += [_ellipse(eye_white, white), _ellipse(pupil, black), _ellipse(highlight, white)]
+    return _document(size, elements)
+
+
+def svg_data_uri(svg: str) -> str:
+    """SVG 文書を data URI に変換（base64 より短い URL エンコード。HTML 属性に埋め込めるよう " は ' に）"""
+    return "data:image/svg+xml;charset=utf-8," + quote(svg.replace('"', "'"), safe=" =:/,.'")
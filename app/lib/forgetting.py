@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 import math
+import numpy as np
 
 LAMBDA = 0.20  # 減衰係数をやや緩めに調整（チューニング可能）
 THETA  = 0.4
@@ -21,15 +22,16 @@ def normalize_views(view_count: int, target: int = VIEWS_TARGET) -> float:
     return min(1.0, math.log(1 + v) / math.log(1 + target))
 
 
-def update_fish_state(fish, now: datetime, reviewed_today: bool, view_count: int = 0):
+def update_fish_state(fish, now: datetime, reviewed_today: bool, view_count: int = 0, lam: float = LAMBDA):
     """Update fish state using mixed model: time decay + engagement from views.
 
     Composite score = w_s * decayed_s + w_e * engagement + w_r * recency
+    lam: 減衰係数（decay_fit で推定した魚ごとの値。未推定なら LAMBDA）
     Returns updated fish object with fields: s, health, status, weight_g, last_update, next_due
     """
     # 経過時間（時間単位）
     hours = (now - fish.last_update).total_seconds() / 3600 if fish.last_update else 9999
-    s_decayed = decay(fish.s, hours)
+    s_decayed = decay(fish.s, hours, lam)
 
     # レビュー日のボーナスは記憶 s に対してだけ適用
     if reviewed_today:
@@ -53,7 +55,7 @@ def update_fish_state(fish, now: datetime, reviewed_today: bool, view_count: int
 
     # 次回 due は decayed s を使って既存ロジックを保つ
     s_for_due = max(s_decayed, 1e-6)
-    next_days = max(1, round(-math.log(THETA / s_for_due) / LAMBDA))
+    next_days = max(1, round(-math.log(THETA / s_for_due) / lam))
     next_due = now + timedelta(days=next_days)
 
     # フィールドに書き戻す
@@ -64,3 +66,133 @@ def update_fish_state(fish, now: datetime, reviewed_today: bool, view_count: int
     fish.last_update = now
     fish.next_due = next_due
     return fish
+
+
+def update_fish_states_batch(s, last_update, weight_g, view_count, now: datetime,
+                             reviewed_today=False, lam=LAMBDA):
+    """update_fish_state のベクトル化版（全ての魚を NumPy で一括計算）
+
+    Args:
+        s: 記憶強度の配列
+        last_update: 最終更新日時の配列（None は未更新として扱う）
+        weight_g: 体重の配列
+        view_count: 視聴回数の配列
+        now: 基準時刻（スカラーまたは魚ごとの配列）
+        reviewed_today: 復習フラグ（スカラーまたは配列）
+        lam: 減衰係数（スカラーまたは魚ごとの配列）
+
+    Returns:
+        dict: s, health, status, weight_g, next_due の配列（next_due は datetime64[us]）
+    """
+    s = np.asarray(s, dtype=float)
+    weight_g = np.asarray(weight_g, dtype=float)
+    views = np.maximum(np.nan_to_num(np.asarray(view_count, dtype=float)), 0)
+    reviewed = np.broadcast_to(np.asarray(reviewed_today, dtype=bool), s.shape)
+
+    # 経過時間（時間単位）。last_update が無い魚は update_fish_state と同じく 9999 時間
+    now64 = np.asarray(now, dtype='datetime64[us]')
+    last64 = np.asarray(last_update, dtype='datetime64[us]')
+    hours = (now64 - last64) / np.timedelta64(1, 'h')
+    hours = np.where(np.isnat(last64), 9999.0, hours)
+    lam = np.asarray(lam, dtype=float)
+    s_decayed = s * np.exp(-lam * np.maximum(hours, 0))
+    s_decayed = np.where(reviewed, np.minimum(1.0, s_decayed + 0.6 * (1.0 - s_decayed)), s_decayed)
+
+    engagement = np.minimum(1.0, np.log1p(np.floor(views)) / math.log(1 + VIEWS_TARGET))
+
+    w_s, w_e, w_r = 0.7, 0.25, 0.05
+    composite = w_s * s_decayed + w_e * engagement + w_r * reviewed
+    composite = np.clip(composite, 0.0, 1.0)
+
+    # round() と同じ偶数丸め
+    health = np.clip(np.rint(100 * composite), 0, 100).astype(int)
+    status = np.where(health == 0, 'dead', np.where(health < 30, 'weak', 'alive'))
+
+    weight = np.maximum(50, weight_g + np.where(reviewed, 5, -2)).astype(int)
+
+    s_for_due = np.maximum(s_decayed, 1e-6)
+    next_days = np.maximum(1, np.rint(-np.log(THETA / s_for_due) / lam)).astype('int64')
+    next_due = now64 + next_days * np.timedelta64(1, 'D')
+
+    return {
+        's': s_decayed,
+        'health': health,
+        'status': status,
+        'weight_g': weight,
+        'next_due': next_due,
+    }
+
+
+def _decay_factors(last_update, times, lam) -> np.ndarray:
+    """exp(-lam * 経過時間) を魚 (N,) × 時刻 (T,) で求める（未更新の魚は update_fish_state と同じく 9999 時間）"""
+    last64 = np.asarray(last_update, dtype='datetime64[us]')
+    times64 = np.asarray(times, dtype='datetime64[us]')
+    lam = np.broadcast_to(np.asarray(lam, dtype=float), last64.shape)  # スカラーも魚ごとの (N,) にそろえる
+    t0 = times64.min()
+    since_last = (t0 - last64) / np.timedelta64(1, 'h')  # (N,)
+    since_t0 = (times64 - t0) / np.timedelta64(1, 'h')   # (T,)
+    never = np.isnat(last64)
+    since_last = np.where(never, 0.0, since_last)
+
+    if np.all(since_last >= 0):
+        # 全ての時刻が最終更新以降なら exp(-lam * (a + b)) = exp(-lam * a) * exp(-lam * b) で外積にできる
+        factors = np.exp(-lam * since_last)[:, None] * np.exp(-lam[:, None] * since_t0)
+    else:
+        factors = np.exp(-lam[:, None] * np.maximum(since_last[:, None] + since_t0, 0))
+    if never.any():
+        factors[never] = np.exp(-lam[never] * 9999)[:, None]
+    return factors
+
+
+def project_health(s, last_update, view_count, times, lam=LAMBDA):
+    """復習しなかった場合の健康度を、魚 × 時刻でまとめて予測する（DB・魚オブジェクトは変更しない）
+
+    update_fish_state(reviewed_today=False) を時刻 T に適用したときの健康度と同じ。
+    減衰は指数関数なので途中で何回自然減衰を適用しても結果は変わらず、閉じた式で直接求められる。
+
+    Args:
+        s: 記憶強度の配列 (N,)
+        last_update: 最終更新日時の配列 (N,)（None は未更新として扱う）
+        view_count: 視聴回数の配列 (N,)
+        times: 予測する時刻の配列 (T,)（datetime または datetime64）
+        lam: 減衰係数（スカラーまたは魚ごとの配列 (N,)。decay_fit の推定値を渡せば水槽の表示と一致する）
+
+    Returns:
+        np.ndarray: (N, T) の健康度（0..100 の int）
+    """
+    s = np.asarray(s, dtype=float)
+    views = np.maximum(np.nan_to_num(np.asarray(view_count, dtype=float)), 0)
+    engagement = np.minimum(1.0, np.log1p(np.floor(views)) / math.log(1 + VIEWS_TARGET))
+
+    composite = (0.7 * s)[:, None] * _decay_factors(last_update, times, lam) + (0.25 * engagement)[:, None]
+    return np.clip(np.rint(100 * np.clip(composite, 0.0, 1.0)), 0, 100).astype(int)
+
+
+def health_drop_time(s, last_update, view_count, threshold: int = 30, lam=LAMBDA):
+    """復習しなかった場合に健康度が threshold 未満になる時刻を閉じた式で求める
+
+    例: 「今週中に弱る（30 未満になる）魚」は health_drop_time(...) < 今 + 7日 で絞り込める。
+
+    Args:
+        s, last_update, view_count: project_health と同じ
+        threshold: 健康度のしきい値
+        lam: 減衰係数（スカラーまたは魚ごとの配列 (N,)）
+
+    Returns:
+        np.ndarray: (N,) の datetime64[us]。元からしきい値未満の魚は last_update、
+                    視聴回数だけでしきい値以上を保つ魚・未更新の魚は NaT
+    """
+    s = np.asarray(s, dtype=float)
+    views = np.maximum(np.nan_to_num(np.asarray(view_count, dtype=float)), 0)
+    engagement = np.minimum(1.0, np.log1p(np.floor(views)) / math.log(1 + VIEWS_TARGET))
+    last64 = np.asarray(last_update, dtype='datetime64[us]')
+    lam = np.asarray(lam, dtype=float)
+
+    # 0.7 * s * exp(-lam * h) + 0.25 * engagement < (threshold - 0.5) / 100 を h について解く
+    limit = (threshold - 0.5) / 100 - 0.25 * engagement
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hours = np.log(0.7 * s / limit) / lam
+    never = limit <= 0
+    hours = np.where(never, 0.0, np.maximum(hours, 0.0))
+    drop = last64 + np.round(hours * 3600e6).astype('int64') * np.timedelta64(1, 'us')
+    return np.where(never, np.datetime64('NaT', 'us'), drop)
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+動画タイトルのジャンル判定
+日本語・英語のキーワードを Aho-Corasick オートマトンに事前コンパイルし、
+タイトルの長さに比例する時間で全キーワードを一度に照合する（結果はタイトルごとにキャッシュ）
+"""
+import unicodedata
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+DEFAULT_GENRE = "一般"
+
+# ジャンル → キーワード（NFKC 正規化・小文字化して照合するので全角/半角・大文字/小文字は区別しない）
+GENRE_KEYWORDS: Dict[str, List[str]] = {
+    "プログラミング": [
+        "プログラミング", "プログラム", "コーディング", "アルゴリズム", "データ構造", "機械学習", "人工知能",
+        "python", "javascript", "typescript", "java", "c++", "rust", "golang", "html", "css", "sql",
+        "programming", "coding", "algorithm", "machine learning", "developer", "api", "git",
+    ],
+    "数学": [
+        "数学", "算数", "微分", "積分", "方程式", "関数", "確率", "統計", "幾何", "線形代数", "ベクトル", "行列",
+        "math", "calculus", "algebra", "geometry", "statistics", "probability",
+    ],
+    "理科": [
+        "理科", "科学", "物理", "化学", "生物", "地学", "宇宙", "天文", "実験", "元素", "細胞", "遺伝",
+        "science", "physics", "chemistry", "biology", "astronomy", "experiment",
+    ],
+    "歴史": [
+        "歴史", "日本史", "世界史", "戦国", "江戸", "幕末", "明治", "古代", "中世", "戦争", "文明",
+        "history", "ancient", "medieval", "war", "civilization",
+    ],
+    "語学": [
+        "英語", "英会話", "英単語", "文法", "発音", "リスニング", "toeic", "toefl", "英検", "韓国語", "中国語",
+        "国語", "古文", "漢文", "漢字",
+        "english", "grammar", "vocabulary", "pronunciation", "language",
+    ],
+    "音楽": [
+        "音楽", "ピアノ", "ギター", "ドラム", "作曲", "楽譜", "歌", "ボーカル", "演奏",
+        "music", "piano", "guitar", "song", "composition",
+    ],
+    "料理": [
+        "料理", "レシピ", "お菓子", "クッキング", "調理", "献立",
+        "cooking", "recipe", "baking",
+    ],
+    "スポーツ": [
+        "スポーツ", "サッカー", "野球", "バスケ", "テニス", "水泳", "筋トレ", "トレーニング", "ストレッチ",
+        "sports", "soccer", "football", "baseball", "basketball", "workout", "fitness",
+    ],
+    "アート": [
+        "アート", "美術", "絵画", "イラスト", "デッサン", "デザイン", "写真", "工作",
+        "art", "drawing", "painting", "illustration", "design",
+    ],
+    "ビジネス": [
+        "ビジネス", "経済", "経営", "マーケティング", "投資", "会計", "簿記", "お金", "起業",
+        "business", "economics", "marketing", "finance", "investing",
+    ],
+}
+
+
+def normalize(text: str) -> str:
+    """照合用の正規化（NFKC + 小文字化）"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+class KeywordMatcher:
+    """
+    複数キーワードの同時照合（Aho-Corasick）
+
+    キーワード数によらず、テキストを1回走査するだけで全ての出現を見つける。
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, str]]):
+        """
+        Args:
+            keywords: (キーワード, ラベル) の組（キーワードは正規化して登録する）
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, int]]] = [[]]  # ノード → [(ラベル, キーワード長)]
+        for keyword, label in keywords:
+            self._add(normalize(keyword), label)
+        self._build()
+
+    def _add(self, keyword: str, label: str):
+        if not keyword:
+            return
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((label, len(keyword)))
+
+    def _build(self):
+        """失敗リンクを幅優先で張り、接尾辞として含まれるキーワードの出力を合流させる"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str, int]]:
+        """
+        テキスト中のキーワードの出現を列挙
+
+        Yields:
+            (開始位置, ラベル, キーワード長)（位置は正規化後のテキスト上）
+        """
+        node = 0
+        for i, ch in enumerate(normalize(text)):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for label, length in self._out[node]:
+                yield i - length + 1, label, length
+
+
+_matcher = KeywordMatcher((kw, genre) for genre, kws in GENRE_KEYWORDS.items() for kw in kws)
+_genre_order = {genre: i for i, genre in enumerate(GENRE_KEYWORDS)}
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and ch.isalnum()
+
+
+def _genre_scores(title: str) -> Dict[str, int]:
+    """ジャンルごとのスコア（一致したキーワードの文字数の合計）"""
+    text = normalize(title)
+    scores: Dict[str, int] = {}
+    for start, genre, length in _matcher.iter_matches(text):
+        end = start + length
+        # 英字キーワードは単語の途中に一致したものを数えない（"art" in "start" など）
+        if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+            continue
+        if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+            continue
+        scores[genre] = scores.get(genre, 0) + length
+    return scores
+
+
+@lru_cache(maxsize=4096)
+def detect_genre(title: str) -> str:
+    """
+    動画タイトルからジャンルを判定（タイトルごとにキャッシュ）
+
+    Returns:
+        str: 一致したキーワードの文字数が最も多いジャンル（同点は GENRE_KEYWORDS の順）。
+             一致しなければ DEFAULT_GENRE
+    """
+    scores = _genre_scores(title)
+    if not scores:
+        return DEFAULT_GENRE
+    return max(scores, key=lambda g: (scores[g], -_genre_order[g]))
+
+
+def detect_genres(titles: Iterable[str]) -> List[str]:
+    """複数のタイトルのジャンルをまとめて判定"""
+    return [detect_genre(title) for title in titles]
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+こってぃくんBIT スプライトのキャッシュ
+元画像（約1MB）を余白トリミングし、複数の解像度に縮小・WebP化してプロセス内で使い回す
+（魚ごとに表示サイズを覆う最小の解像度を選び、小さい魚に大きな画像を送らない）
+"""
+import os
+import io
+import base64
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Iterable
+from PIL import Image, ImageChops, features
+
+# プロジェクトルート直下のフォルダ
+KOTTI_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'こってぃくんBIT')
+
+KOTTI_FILES = [
+    ('normal', '①ノーマル.jpg'),
+    ('cry', '②泣く.png'),
+    ('smile', '③笑う.png'),
+    ('sparkle', '④きらきら.png'),
+    ('legend', '⑤伝説.png'),
+]
+
+# 水槽での魚の表示枠（size_factor=1.0 のとき）
+SPRITE_BASE_SIZE = (80, 40)
+# 解像度の段（SPRITE_BASE_SIZE に対する倍率、昇順）。最大の段より大きい魚は最大の段を拡大表示する
+SPRITE_SCALES = (1, 2, 3)
+
+# 背景色との差がこの値以下のピクセルは余白とみなす（JPEG ノイズ対策）
+_CROP_THRESHOLD = 20
+
+_lock = threading.Lock()
+
+
+def sprite_scale_for(size_factor: float) -> int:
+    """表示倍率 size_factor を覆う最小の解像度の段"""
+    for scale in SPRITE_SCALES:
+        if size_factor <= scale:
+            return scale
+    return SPRITE_SCALES[-1]
+
+
+def sprite_variant(key: str, scale: int) -> str:
+    """スプライトキーと解像度の段から、水槽に渡すキー（CSS クラス名にも使う）を作る"""
+    return f"{key}-{scale}x"
+
+
+def autocrop(img: Image.Image) -> Image.Image:
+    """透明または背景色（左上ピクセル）の余白を切り取る"""
+    if img.mode in ('RGBA', 'LA') or 'transparency' in img.info:
+        bbox = img.convert('RGBA').getchannel('A').getbbox()
+    else:
+        rgb = img.convert('RGB')
+        bg = Image.new('RGB', rgb.size, rgb.getpixel((0, 0)))
+        diff = ImageChops.difference(rgb, bg)
+        diff = ImageChops.add(diff, diff, 2.0, -_CROP_THRESHOLD)
+        bbox = diff.getbbox()
+    return img.crop(bbox) if bbox else img
+
+
+def encode_sprite(img: Image.Image) -> str:
+    """スプライトを data URI に変換（WebP が使えなければパレット PNG）"""
+    buffer = io.BytesIO()
+    if features.check('webp'):
+        img.save(buffer, format='WEBP', quality=80, method=6)
+        mime = 'image/webp'
+    else:
+        img.convert('RGBA').quantize(colors=128, method=Image.Quantize.FASTOCTREE).save(
+            buffer, format='PNG', optimize=True)
+        mime = 'image/png'
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+@lru_cache(maxsize=32)
+def _build_sprite_ladder(path: str, mtime_ns: int) -> Dict[int, str]:
+    """1枚分のスプライトを全ての段で生成（mtime が変わればキーが変わり再生成される）"""
+    with Image.open(path) as src:
+        img = autocrop(src)
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    w, h = SPRITE_BASE_SIZE
+    ladder = {}
+    for scale in SPRITE_SCALES:
+        # 元画像の読み込み・トリミングは1回だけ、縮小は段ごと
+        variant = img.copy()
+        variant.thumbnail((w * scale, h * scale), Image.Resampling.LANCZOS)
+        ladder[scale] = encode_sprite(variant)
+    return ladder
+
+
+def load_kotti_sprites() -> Dict[str, Dict[int, str]]:
+    """
+    こってぃくんBIT の縮小済みスプライトを取得
+
+    Returns:
+        dict: スプライトキー（normal, cry, ...）→ {解像度の段: data URI}。存在しない画像は含まない
+    """
+    sprites = {}
+    with _lock:
+        for key, fname in KOTTI_FILES:
+            path = os.path.join(KOTTI_DIR, fname)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            try:
+                sprites[key] = _build_sprite_ladder(path, mtime_ns)
+            except Exception as e:
+                print(f"スプライト生成エラー ({fname}): {e}")
+    return sprites
+
+
+def used_sprites(sprites: Dict[str, Dict[int, str]], fish: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    魚データが参照している解像度のスプライトだけを取り出す（水槽コンポーネントに送る分）
+
+    Args:
+        sprites: load_kotti_sprites の結果
+        fish: tank_fish_entry で作成した魚データ（sprite は sprite_variant のキー）
+
+    Returns:
+        dict: sprite_variant のキー → data URI
+    """
+    variants = {sprite_variant(key, scale): uri
+                for key, ladder in sprites.items() for scale, uri in ladder.items()}
+    return {f['sprite']: variants[f['sprite']] for f in fish if f.get('sprite') in variants}
@@ -1,4 +1,5 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from datetime import datetime
 from typing import Optional
 
@@ -13,7 +14,8 @@ class Video(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class View(SQLModel, table=True):
-    __table_args__ = {"extend_existing": True}
+    # 魚ごとのイベント（視聴）を時刻順に範囲スキャンするための複合インデックス（fish_events）
+    __table_args__ = (Index("ix_view_video_viewed", "video_id", "viewed_at"), {"extend_existing": True})
     id: Optional[int] = Field(default=None, primary_key=True)
     video_id: int = Field(foreign_key="video.id")
     viewed_at: datetime = Field(default_factory=datetime.utcnow)
@@ -30,5 +32,29 @@ class Fish(SQLModel, table=True):
     weight_g: int = 100
     last_update: datetime = Field(default_factory=datetime.utcnow)
     status: str = "alive"        # 'alive'|'weak'|'dead'
-    next_due: Optional[datetime] = None
+    next_due: Optional[datetime] = Field(default=None, index=True)  # 復習キュー（review_queue）で範囲スキャン
     fish_color: str = "#FF6B6B"  # 金魚の色（HEXコード）
+
+# 視聴履歴から推定した魚ごとの減衰係数（decay_fit で作成、tank_data.evaluate_current_state・fish_events.derive_states で使う）
+class FishDecayRate(SQLModel, table=True):
+    __table_args__ = {"extend_existing": True}
+    fish_id: int = Field(foreign_key="fish.id", primary_key=True)
+    lam: float = 0.20            # 減衰係数（forgetting.LAMBDA と同じ単位）
+    n_intervals: int = 0         # 推定に使った視聴間隔の数
+    fitted_at: datetime = Field(default_factory=datetime.utcnow)
+
+# 視聴イベントを畳み込んだ魚の状態のスナップショット（fish_events で作成、再計算はここから再開する）
+class FishSnapshot(SQLModel, table=True):
+    __table_args__ = {"extend_existing": True}
+    id: Optional[int] = Field(default=None, primary_key=True)
+    fish_id: int = Field(foreign_key="fish.id", index=True)
+    event_count: int = 0         # 畳み込んだ視聴の数
+    last_view_id: int = 0        # 最後に畳み込んだ視聴の ID
+    at: datetime                 # 最後に畳み込んだ視聴の時刻（この時点の状態）
+    s: float
+    health: int
+    weight_g: int
+    status: str
+    next_due: Optional[datetime] = None
+    lam: float = 0.20            # 畳み込みに使った減衰係数
+    created_at: datetime = Field(default_factory=datetime.utcnow)
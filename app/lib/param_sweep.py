@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+忘却モデルのパラメータスイープ
+実際の視聴履歴を、LAMBDA・THETA・VIEWS_TARGET・重み w_s/w_e/w_r の組み合わせごとに再生し、
+健康度の分布と復習の負荷を比較する（設定 × 魚 × 時刻を1回のブロードキャスト計算で求める）
+
+    python -m app.lib.param_sweep --lam 0.05:0.5:10 --theta 0.3,0.4,0.5 --views-target 1,2,4
+"""
+import argparse
+import json
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+import numpy as np
+from sqlmodel import Session, select
+from .models import Fish, Video, View
+from .forgetting import LAMBDA, THETA, VIEWS_TARGET
+from .fish_events import INITIAL_S
+
+# スイープするパラメータ（名前 → 現在の値）
+PARAMS = {
+    'lam': LAMBDA,
+    'theta': THETA,
+    'views_target': VIEWS_TARGET,
+    'w_s': 0.7,
+    'w_e': 0.25,
+    'w_r': 0.05,
+}
+
+# 1チャンク（設定 × 魚 × 時刻）の要素数の上限（メモリ使用量の目安: 要素数 × 約 50 バイト）
+MAX_CHUNK_ELEMENTS = 2_000_000
+
+_HOUR = np.timedelta64(1, 'h')
+
+
+def make_grid(**axes: Sequence[float]) -> Dict[str, np.ndarray]:
+    """
+    パラメータの全ての組み合わせを作る（指定しなかったパラメータは現在の値に固定）
+
+    Returns:
+        dict: パラメータ名 → 設定ごとの値 (P,)
+    """
+    values = [np.atleast_1d(np.asarray(axes.get(name, default), dtype=float)) for name, default in PARAMS.items()]
+    mesh = np.meshgrid(*values, indexing='ij')
+    return {name: m.ravel() for name, m in zip(PARAMS, mesh)}
+
+
+def load_histories(ses: Session, until: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+    """
+    全ての魚の登録時刻と視聴時刻を取得（視聴は魚ごとに時刻順、足りない分は NaT で埋める）
+
+    Returns:
+        dict: fish_id (N,)、created (N,)、events (N, E)
+    """
+    fish_rows = ses.exec(
+        select(Fish.id, Video.created_at).join(Video, Video.id == Fish.video_id).order_by(Fish.id)
+    ).all()
+    stmt = (
+        select(Fish.id, View.viewed_at)
+        .join(View, View.video_id == Fish.video_id)
+        .order_by(Fish.id, View.viewed_at, View.id)
+    )
+    if until is not None:
+        stmt = stmt.where(View.viewed_at <= until)
+    view_rows = ses.exec(stmt).all()
+
+    fish_ids = np.array([fish_id for fish_id, _ in fish_rows], dtype=int)
+    created = np.array([created_at for _, created_at in fish_rows], dtype='datetime64[us]')
+    row_of = {fish_id: i for i, fish_id in enumerate(fish_ids.tolist())}
+    per_fish = np.zeros(len(fish_ids), dtype=int)
+    for fish_id, _ in view_rows:
+        per_fish[row_of[fish_id]] += 1
+    events = np.full((len(fish_ids), int(per_fish.max(initial=0))), np.datetime64('NaT'), dtype='datetime64[us]')
+    col = np.zeros(len(fish_ids), dtype=int)
+    for fish_id, viewed_at in view_rows:
+        i = row_of[fish_id]
+        events[i, col[i]] = viewed_at
+        col[i] += 1
+    return {'fish_id': fish_ids, 'created': created, 'events': events}
+
+
+def _timeline(history: Dict[str, np.ndarray], times: np.ndarray) -> Dict[str, np.ndarray]:
+    """設定によらない量（各時刻までの視聴回数・直前のイベントの時刻など）を魚 × 時刻で求める"""
+    created = history['created']
+    events = history['events']
+    # 日付の境界が 24 時間の倍数になるよう、基準は最初の登録日の 0 時
+    origin = created.min().astype('datetime64[D]').astype('datetime64[us]')
+    created_h = (created - origin) / _HOUR
+    events_h = (events - origin) / _HOUR  # NaT は nan
+    times_h = (times - origin) / _HOUR
+
+    # 各時刻までの視聴回数 k（nan との比較は False）
+    k = (events_h[:, None, :] <= times_h[None, :, None]).sum(axis=2)             # (N, T)
+    anchor_h = np.concatenate([created_h[:, None], events_h], axis=1)           # (N, E+1)
+    anchor_h = np.take_along_axis(anchor_h, k, axis=1)                           # (N, T) 直前のイベント（無ければ登録）
+    same_day = (k > 0) & (np.floor(anchor_h / 24) == np.floor(times_h / 24)[None, :])
+    return {
+        'created_h': created_h,
+        'events_h': events_h,
+        'times_h': times_h,
+        'k': k,
+        'elapsed_h': np.where(same_day, 0.0, times_h[None, :] - anchor_h),
+        'same_day': same_day,
+        'valid': times_h[None, :] >= created_h[:, None],                         # 登録後の時刻だけ集計
+    }
+
+
+def _sweep_chunk(tl: Dict[str, np.ndarray], p: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """設定のチャンク (Pc,) について、健康度のヒストグラムと復習の負荷を求める"""
+    lam = p['lam'][:, None]                                                      # (Pc, 1)
+    n_params = len(p['lam'])
+    events_h = tl['events_h']
+    n_fish, n_events = events_h.shape
+
+    # 視聴イベントを順に畳み込む（減衰してから復習ボーナス）。イベントの無い魚・回は s を変えない
+    s = np.full((n_params, n_fish), INITIAL_S)
+    s_after = np.empty((n_params, n_fish, n_events + 1))
+    due_h = np.full((n_params, n_fish, n_events + 1), np.inf)
+    s_after[:, :, 0] = s
+    prev_h = tl['created_h']
+    for j in range(n_events):
+        t_h = events_h[:, j]
+        has = ~np.isnan(t_h)
+        dt = np.where(has, np.maximum(t_h - prev_h, 0), 0.0)
+        boosted = s * np.exp(-lam * dt)
+        boosted = np.minimum(1.0, boosted + 0.6 * (1.0 - boosted))
+        s = np.where(has, boosted, s)
+        s_after[:, :, j + 1] = s
+        # 次回の復習期限（update_fish_state と同じく復習後の s から日数を求める）
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days = np.maximum(1, np.rint(-np.log(p['theta'][:, None] / np.maximum(s, 1e-6)) / lam))
+        due_h[:, :, j + 1] = np.where(has, t_h + 24 * days, np.inf)
+        prev_h = np.where(has, t_h, prev_h)
+
+    # 各時刻の健康度（設定 × 魚 × 時刻）
+    k = tl['k'][None]
+    s_t = np.take_along_axis(s_after, k, axis=2) * np.exp(-lam[:, :, None] * tl['elapsed_h'][None])
+    engagement = np.minimum(1.0, np.log1p(k) / np.log1p(p['views_target'])[:, None, None])
+    composite = (p['w_s'][:, None, None] * s_t + p['w_e'][:, None, None] * engagement
+                 + p['w_r'][:, None, None] * tl['same_day'][None])
+    health = np.clip(np.rint(100 * composite), 0, 100).astype(np.int64)
+
+    valid = tl['valid']
+    rows = np.arange(n_params)[:, None] * 101
+    hist = np.bincount((health[:, valid] + rows).ravel(), minlength=n_params * 101).reshape(n_params, 101)
+
+    # 復習の負荷: 期限切れの魚の割合（時刻平均）と、復習ごとに決まる次回までの平均日数
+    due = (tl['times_h'][None, None, :] >= np.take_along_axis(due_h, k, axis=2))[:, valid]
+    intervals = (due_h[:, :, 1:] - events_h[None]) / 24
+    has_event = ~np.isnan(events_h)
+    return {
+        'hist': hist,
+        'due_rate': due.mean(axis=1) if due.shape[1] else np.zeros(n_params),
+        'mean_interval_days': (intervals[:, has_event].mean(axis=1) if has_event.any()
+                               else np.full(n_params, np.nan)),
+    }
+
+
+def sweep(history: Dict[str, np.ndarray], grid: Dict[str, np.ndarray], times,
+          max_chunk_elements: int = MAX_CHUNK_ELEMENTS) -> Dict[str, np.ndarray]:
+    """
+    視聴履歴を全ての設定で再生し、設定ごとに健康度の分布と復習の負荷を求める
+
+    健康度は水槽の表示と同じく、その日に復習した魚は復習時点の値、それ以外は (s, 最終復習時刻) からの減衰で求める。
+    設定はメモリに収まる大きさのチャンクに分けて処理する（チャンク内は設定 × 魚 × 時刻のブロードキャスト）。
+
+    Args:
+        history: load_histories の結果
+        grid: make_grid の結果（パラメータ名 → (P,)）
+        times: 評価する時刻 (T,)
+        max_chunk_elements: 1チャンクの 設定 × 魚 × 時刻 の要素数の上限
+
+    Returns:
+        dict: grid の各パラメータと、設定ごとの hist (P, 101)・mean・p10・p50・p90・weak_rate・dead_rate・
+              due_rate（期限切れの魚の割合）・mean_interval_days（復習間隔の平均日数）
+    """
+    times = np.atleast_1d(np.asarray(times, dtype='datetime64[us]'))
+    n_params = len(grid['lam'])
+    n_fish = len(history['fish_id'])
+    tl = _timeline(history, times) if n_fish else None
+
+    hist = np.zeros((n_params, 101), dtype=np.int64)
+    due_rate = np.zeros(n_params)
+    mean_interval = np.full(n_params, np.nan)
+    if tl is not None:
+        per_setting = n_fish * max(len(times), history['events'].shape[1] + 1)
+        chunk = max(1, max_chunk_elements // per_setting)
+        for start in range(0, n_params, chunk):
+            part = {name: values[start:start + chunk] for name, values in grid.items()}
+            result = _sweep_chunk(tl, part)
+            hist[start:start + chunk] = result['hist']
+            due_rate[start:start + chunk] = result['due_rate']
+            mean_interval[start:start + chunk] = result['mean_interval_days']
+
+    # ヒストグラムから分布の要約（健康度は 0..100 の整数なので並べ替え不要）
+    total = hist.sum(axis=1)
+    safe_total = np.maximum(total, 1)
+    cdf = np.cumsum(hist, axis=1) / safe_total[:, None]
+    summary = {
+        'mean': hist @ np.arange(101) / safe_total,
+        'p10': np.argmax(cdf >= 0.1, axis=1),
+        'p50': np.argmax(cdf >= 0.5, axis=1),
+        'p90': np.argmax(cdf >= 0.9, axis=1),
+        'weak_rate': hist[:, 1:30].sum(axis=1) / safe_total,
+        'dead_rate': hist[:, 0] / safe_total,
+    }
+    return dict(grid, hist=hist, **summary, due_rate=due_rate, mean_interval_days=mean_interval)
+
+
+def _parse_axis(text: str) -> np.ndarray:
+    """'0.1,0.2' は列挙、'開始:終了:個数' は等間隔"""
+    if ':' in text:
+        start, stop, num = text.split(':')
+        return np.linspace(float(start), float(stop), int(num))
+    return np.array([float(v) for v in text.split(',')])
+
+
+if __name__ == '__main__':
+    # 例: python -m app.lib.param_sweep --lam 0.05:0.5:10 --theta 0.3:0.5:5 --days 90 --top 10
+    import time
+    from .db import init_db, get_session
+
+    parser = argparse.ArgumentParser(description="忘却モデルのパラメータスイープ")
+    for name in PARAMS:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help=f"{name} の値（既定 {PARAMS[name]}）")
+    parser.add_argument("--days", type=int, default=90, help="評価する日数（今日から遡って1日ごと）")
+    parser.add_argument("--sort", default="p50", help="並べ替えに使う列（降順）")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--output", help="全ての設定の結果を書き出す JSON ファイル")
+    args = parser.parse_args()
+
+    init_db()
+    now = np.datetime64(datetime.utcnow(), 'us')
+    times = now - np.arange(args.days)[::-1] * np.timedelta64(1, 'D')
+    grid = make_grid(**{name: _parse_axis(getattr(args, name)) for name in PARAMS if getattr(args, name)})
+    with get_session() as ses:
+        history = load_histories(ses)
+
+    started = time.perf_counter()
+    result = sweep(history, grid, times)
+    elapsed = time.perf_counter() - started
+    print(f"{len(grid['lam'])} 設定 × {len(history['fish_id'])} 匹 × {len(times)} 日: {elapsed:.2f} 秒")
+
+    columns = list(PARAMS) + ['mean', 'p10', 'p50', 'p90', 'weak_rate', 'dead_rate', 'due_rate', 'mean_interval_days']
+    print(" ".join(f"{c:>10}" for c in columns))
+    for i in np.argsort(-result[args.sort], kind='stable')[:args.top]:
+        print(" ".join(f"{float(result[c][i]):>10.3f}" for c in columns))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({c: np.asarray(v).tolist() for c, v in result.items()}, f, ensure_ascii=False)
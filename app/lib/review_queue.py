@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+復習キュー
+Fish.next_due（インデックス付き）から「今復習すべき魚」を期限の古い順に取り出す
+"""
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional
+from sqlmodel import Session, select
+from .models import Fish
+from .tank_data import load_tank_version
+
+# ヒープに読み込む魚の上限（表示する件数より多めに持ち、視聴で減っても読み直さずに済むようにする）
+REVIEW_QUEUE_WINDOW = 50
+
+
+class DueFish(NamedTuple):
+    """復習キューの1件"""
+    next_due: datetime
+    fish_id: int
+    video_id: int
+
+
+def load_due_fish(ses: Session, now: datetime, limit: int = 10) -> List[Fish]:
+    """
+    期限切れの魚を緊急度順（next_due の古い順、同じなら ID 順）に上位 limit 件取得
+
+    ix_fish_next_due の範囲スキャンで先頭から limit 件だけ読む（全件の走査・ソートはしない）。
+    next_due が未設定の魚（一度も状態更新されていない魚）は含まない。
+    """
+    stmt = (
+        select(Fish)
+        .where(Fish.next_due.is_not(None), Fish.next_due <= now)
+        .order_by(Fish.next_due, Fish.id)
+        .limit(limit)
+    )
+    return list(ses.exec(stmt).all())
+
+
+class ReviewQueue:
+    """
+    復習キューのメモリ上のヒープ
+
+    - load_due_fish の範囲スキャンで、当日中に期限が来る魚を緊急度順に window 件まで読み込む
+    - 順序は (next_due, fish_id) で決まるので、再実行しても同じ並びになる
+    - 視聴記録で1匹の next_due が変わったら update で差し替える（古いエントリは取り出し時に捨てる）
+    - 他の経路（自然減衰・削除など）で DB が変わったら sync で読み直す（日付が変わったときも読み直す）
+    """
+
+    def __init__(self, window: int = REVIEW_QUEUE_WINDOW):
+        self.window = window
+        self._heap: List[DueFish] = []
+        self._entries: Dict[int, DueFish] = {}
+        self._bound: Optional[tuple] = None   # 読み込んだ範囲の末尾 (next_due, fish_id)
+        self._truncated = False               # window 件で打ち切った（DB に続きが残っている）
+        self.version: Optional[tuple] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, ses: Session, now: Optional[datetime] = None):
+        """当日中（翌日 0 時まで）に期限が来る魚を DB から window 件まで読み込んでヒープを作り直す"""
+        now = now or datetime.utcnow()
+        until = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+        fish = load_due_fish(ses, until, limit=self.window)
+        self._entries = {f.id: DueFish(f.next_due, f.id, f.video_id) for f in fish}
+        self._heap = list(self._entries.values())
+        heapq.heapify(self._heap)
+        self._truncated = len(fish) == self.window
+        # 打ち切った場合は最後の1件まで、そうでなければ翌日 0 時までの魚が全てヒープにある
+        self._bound = (fish[-1].next_due, fish[-1].id) if self._truncated else (until, float('inf'))
+        self.version = load_tank_version(ses)
+
+    def sync(self, ses: Session):
+        """
+        DB のフィンガープリントが前回の読み込み・更新から変わっていれば読み直す
+        打ち切って読み込んだヒープが視聴で半分未満に減った場合も、続きを読むために読み直す。
+        """
+        if load_tank_version(ses) != self.version or (self._truncated and len(self) < self.window // 2):
+            self.load(ses)
+
+    def mark_synced(self, ses: Session, before: tuple):
+        """
+        update / remove で反映済みの変更を DB と同期済みとして記録（次の sync で読み直さない）
+
+        before はこのセッションで書き込む前に load_tank_version で読んだ値。
+        それが前回の同期時と違えば他のセッションの変更が入っているので、同期済みにせず読み直す。
+        """
+        if self.version is None:  # 一度も読み込んでいなければ次の sync で全件読む
+            return
+        if before == self.version:
+            self.version = load_tank_version(ses)
+        else:
+            self.load(ses)
+
+    def update(self, fish: Fish):
+        """1匹分の next_due を差し替える（O(log n)）"""
+        # 読み込んだ範囲より後になった魚は外す（範囲外の魚との順序はヒープだけでは決まらない）
+        if fish.next_due is None or self._bound is None or (fish.next_due, fish.id) > self._bound:
+            self.remove(fish.id)
+            return
+        entry = DueFish(fish.next_due, fish.id, fish.video_id)
+        if self._entries.get(fish.id) == entry:
+            return
+        self._entries[fish.id] = entry
+        heapq.heappush(self._heap, entry)
+        # 古いエントリが溜まりすぎたら作り直す
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def remove(self, fish_id: int):
+        """魚をキューから外す（ヒープ上のエントリは取り出し時に捨てる）"""
+        self._entries.pop(fish_id, None)
+
+    def due(self, now: datetime, k: int = 10) -> List[DueFish]:
+        """
+        期限切れの魚を緊急度順に最大 k 件（O(k log n)、キューの中身は変えない）
+        """
+        result: List[DueFish] = []
+        while self._heap and len(result) < k:
+            entry = self._heap[0]
+            if self._entries.get(entry.fish_id) != entry:
+                heapq.heappop(self._heap)  # 差し替え・削除済みの古いエントリ
+                continue
+            if entry.next_due > now:
+                break
+            result.append(heapq.heappop(self._heap))
+        for entry in result:
+            heapq.heappush(self._heap, entry)
+        return result
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+データ駆動の水槽コンポーネント
+静的なシェル（tank_frontend/index.html）に魚の JSON リストだけを渡して描画する
+"""
+import os
+from typing import Any, Dict, List
+import streamlit.components.v1 as components
+
+# 静的シェルは Streamlit が1回だけ配信し、ブラウザ側でキャッシュ・DOM を保持する
+_FRONTEND_DIR = os.path.join(os.path.dirname(__file__), 'tank_frontend')
+_tank_component = components.declare_component('fish_tank', path=_FRONTEND_DIR)
+
+
+def tank_fish_entry(fish_id: int, sprite, size: float, speed: float, opacity: float,
+                    label: str, health: float, evolution: float = 1.0,
+                    legendary: bool = False, color: str = "#FF6B6B",
+                    emoji: str = "🐠") -> Dict[str, Any]:
+    """
+    水槽に渡す魚1匹分のデータを作成
+
+    Args:
+        fish_id: 魚ID（DOM の再利用キー・高さの決定に使う）
+        sprite: スプライトキー（kotti_sprites.sprite_variant の解像度付きキー。None の場合は絵文字で表示）
+        size: サイズ倍率（80×40px に対する倍率）
+        speed: 1周の秒数
+        opacity: 透明度
+        label: 表示名
+
+    Returns:
+        dict: JSON 化可能な魚データ
+    """
+    return {
+        'id': fish_id,
+        'sprite': sprite,
+        'size': round(size, 3),
+        'speed': round(speed, 2),
+        'opacity': round(opacity, 2),
+        'label': label,
+        'health': round(float(health), 1),
+        'evo': round(evolution, 1),
+        'legend': bool(legendary),
+        'color': color,
+        'emoji': emoji,
+    }
+
+
+def render_fish_tank(fish: List[Dict[str, Any]], sprites: Dict[str, str],
+                     show_bubbles: bool = True, show_decorations: bool = True,
+                     key: str = "fish_tank"):
+    """
+    水槽コンポーネントを描画
+
+    Args:
+        fish: tank_fish_entry で作成した魚データのリスト
+        sprites: スプライトキー → data URI
+        show_bubbles: 泡を表示するか
+        show_decorations: 水草・装飾を表示するか
+        key: コンポーネントキー（同じキーならブラウザ側の DOM が再利用される）
+    """
+    return _tank_component(
+        fish=fish,
+        sprites=sprites,
+        show_bubbles=show_bubbles,
+        show_decorations=show_decorations,
+        key=key,
+        default=None,
+    )
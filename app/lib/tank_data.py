@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+水槽表示用のデータローダー
+Fish / Video / View を1回の JOIN + GROUP BY で集計して取得する
+"""
+from datetime import datetime
+from typing import List, NamedTuple, Optional, Tuple
+from sqlmodel import Session, select, func
+from .models import Fish, Video, View
+from .forgetting import LAMBDA, normalize_views, update_fish_states_batch
+from .decay_fit import load_decay_rates
+
+
+class TankRow(NamedTuple):
+    """水槽の1匹分のデータ"""
+    fish: Fish
+    video: Video
+    view_count: int
+    total_duration: int               # 合計視聴秒数（記録なしは0）
+    avg_comprehension: Optional[float]  # 理解度平均（1..3、記録なしはNone）
+
+
+def load_tank_rows(ses: Session, now: Optional[datetime] = None,
+                   video_ids: Optional[List[int]] = None) -> List[TankRow]:
+    """
+    全ての金魚を動画・視聴集計と一緒に取得
+
+    Args:
+        ses: データベースセッション
+        now: 指定すると、その時刻の健康度・状態・体重を読み出し時に計算する（DB は変更しない）
+        video_ids: 指定すると、その動画の魚だけ取得
+
+    Returns:
+        list: TankRow のリスト（動画が存在しない魚は含まない）
+    """
+    stmt = (
+        select(
+            Fish,
+            Video,
+            func.count(View.id),
+            func.coalesce(func.sum(View.duration_sec), 0),
+            func.avg(View.comprehension),
+        )
+        .join(Video, Video.id == Fish.video_id)
+        .outerjoin(View, View.video_id == Video.id)
+        .group_by(Fish.id, Video.id)
+        .order_by(Fish.id)
+    )
+    if video_ids is not None:
+        stmt = stmt.where(Video.id.in_(video_ids))
+    rows = []
+    for fish, video, view_count, total_duration, avg_comprehension in ses.exec(stmt).all():
+        rows.append(TankRow(
+            fish=fish,
+            video=video,
+            view_count=int(view_count or 0),
+            total_duration=int(total_duration or 0),
+            avg_comprehension=float(avg_comprehension) if avg_comprehension is not None else None,
+        ))
+    if now is not None:
+        evaluate_current_state(ses, rows, now)
+    return rows
+
+
+def evaluate_current_state(ses: Session, rows: List[TankRow], now: datetime) -> int:
+    """
+    当日未更新の魚の健康度・状態・体重を、保存済みの (s, last_update) から読み出し時に計算する
+
+    DB には書き込まない（保存するのは視聴＝復習イベントのときだけ）。減衰は指数関数なので、
+    毎日書き戻していたときと同じ s が (s, last_update) から直接求まる。体重は日付が変わるごとに -2。
+    計算した値が DB に flush されないよう、書き換える魚はセッションから切り離す。
+    s・last_update・next_due は保存値のまま（事前生成した画像のキャッシュキーも変わらない）。
+
+    Args:
+        ses: データベースセッション
+        rows: load_tank_rows の結果
+        now: 基準時刻（UTC）
+
+    Returns:
+        int: 計算し直した魚の数
+    """
+    today = now.date()
+    stale = [r for r in rows if r.fish.last_update is None or r.fish.last_update.date() < today]
+    if not stale:
+        return 0
+
+    # 視聴履歴から推定済みの魚は、その減衰係数を使う
+    rates = load_decay_rates(ses, [r.fish.id for r in stale])
+    result = update_fish_states_batch(
+        [r.fish.s for r in stale],
+        [r.fish.last_update for r in stale],
+        [r.fish.weight_g for r in stale],
+        [r.view_count for r in stale],
+        now,
+        reviewed_today=False,
+        lam=[rates.get(r.fish.id, LAMBDA) for r in stale],
+    )
+    for i, r in enumerate(stale):
+        fish = r.fish
+        ses.expunge(fish)
+        days = (today - fish.last_update.date()).days if fish.last_update else 1
+        fish.health = int(result['health'][i])
+        fish.status = str(result['status'][i])
+        fish.weight_g = max(50, fish.weight_g - 2 * max(days, 1))
+    return len(stale)
+
+
+def health_range(view_count: int) -> Tuple[int, int]:
+    """
+    set_fish_health で設定できる健康度の範囲 (最小, 最大)
+
+    健康度は 0.7 × s + 0.25 × エンゲージメント（s は 0..1）なので、視聴回数で下限・上限が決まる
+    （復習当日の +5 は含まない）。
+    """
+    engagement = 0.25 * normalize_views(view_count)
+    return round(100 * engagement), round(100 * min(1.0, 0.7 + engagement))
+
+
+def set_fish_health(ses: Session, fish: Fish, health: int, now: datetime, view_count: int) -> int:
+    """
+    魚の健康度を指定した値にする（読み出し時の計算でも同じ値になるよう s・last_update も書き込む）
+
+    健康度は (s, last_update) から読み出し時に計算し直すので、health だけ書き換えても翌日には元に戻る。
+    last_update を now にし、経過時間 0 で指定の健康度になる s を逆算する（以降は通常どおり減衰する）。
+    health_range の範囲外の値はその端に丸めて設定し、実際に設定した値を返す。
+    次の視聴で視聴ログから導出し直すまで有効。commit は呼び出し側で行う。
+
+    Args:
+        ses: データベースセッション
+        fish: 書き込む魚（ses に属する行）
+        health: 設定したい健康度（0..100）
+        now: 基準時刻（UTC）
+        view_count: 視聴回数
+
+    Returns:
+        int: 設定した健康度
+    """
+    # 読み出し時の計算と同じく、推定済みの魚はその減衰係数を使う（次回の復習期限に影響する）
+    lam = load_decay_rates(ses, [fish.id]).get(fish.id, LAMBDA)
+    s = (health / 100 - 0.25 * normalize_views(view_count)) / 0.7
+    result = update_fish_states_batch([min(1.0, max(0.0, s))], [now], [fish.weight_g], [view_count], now,
+                                      reviewed_today=False, lam=lam)
+    fish.s = float(result['s'][0])
+    fish.health = int(result['health'][0])
+    fish.status = str(result['status'][0])
+    fish.last_update = now
+    fish.next_due = result['next_due'][0].item()
+    return fish.health
+
+
+def load_tank_version(ses: Session) -> tuple:
+    """
+    水槽の内容が変わったかどうかを判定するための軽量なフィンガープリントを取得
+
+    魚の数・健康度合計・最終更新、視聴の件数・最大IDを1回の集計クエリで返す。
+    値が前回と同じなら水槽の再読み込みは不要。
+    健康度などは読み出し時に日単位で計算し直すので、当日の日付も含める。
+    """
+    stmt = select(
+        select(func.count(Fish.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(Fish.health), 0)).scalar_subquery(),
+        select(func.max(Fish.last_update)).scalar_subquery(),
+        select(func.count(View.id)).scalar_subquery(),
+        select(func.max(View.id)).scalar_subquery(),
+    )
+    row = ses.exec(stmt).one()
+    return tuple(str(v) if isinstance(v, datetime) else v for v in row) + (str(datetime.utcnow().date()),)
@@ -90,11 +90,17 @@ except Exception:
 from PIL import Image, ImageDraw
 
 # モデルを先にインポートしてからデータベース初期化
-from app.lib.models import Video, View, Fish
+from app.lib.models import Video, View, Fish, FishDecayRate, FishSnapshot
 from app.lib.db import init_db, get_session
 from app.lib.youtube import fetch_meta
 from app.lib.summary import simple_summary
-from app.lib.forgetting import update_fish_state
+from app.lib.decay_fit import decay_rates_stale
+from app.lib.fish_events import record_view_event, refit_decay_rates
+from app.lib.tank_data import load_tank_rows, load_tank_version, health_range, set_fish_health
+from app.lib.fish_pregen import pregenerate_fish_images
+from app.lib.review_queue import ReviewQueue
+
+REVIEW_QUEUE_STATE_KEY = '_review_queue'
 
 # データベース初期化を実行（エラーハンドリング追加）
 try:
@@ -103,6 +109,15 @@ except Exception as e:
     st.error(f"データベース初期化エラー: {str(e)}")
     st.info("アプリケーションの再起動を試してください。")
 
+# 減衰係数の定期推定（視聴のたびではなく、前回から DECAY_FIT_INTERVAL 以上経っていれば全ての魚をまとめて推定し直す）
+try:
+    with get_session() as _fit_session:
+        if decay_rates_stale(_fit_session):
+            refit_decay_rates(_fit_session)
+            _fit_session.commit()
+except Exception as e:
+    st.warning(f"減衰係数の推定でエラー: {str(e)}")
+
 # ヘッダ用: 画像を base64 埋め込みにして透明背景で表示するユーティリティ
 def _img_to_data_uri(path: str) -> str:
     """Return data URI for a PNG/JPEG image at path."""
@@ -154,6 +169,21 @@ def _ensure_transparent_logo(path: str) -> str:
     return processed_path
 
 
+def _review_queue() -> ReviewQueue:
+    """セッションごとの復習キュー（再実行しても同じ並びを保つため session_state に保持）"""
+    if REVIEW_QUEUE_STATE_KEY not in st.session_state:
+        st.session_state[REVIEW_QUEUE_STATE_KEY] = ReviewQueue()
+    return st.session_state[REVIEW_QUEUE_STATE_KEY]
+
+
+def _tank_user_id():
+    """水槽で高度な魚を表示するユーザーの ID（render_animated_tank と同じ条件。該当しなければ None）"""
+    if not st.session_state.get('logged_in', False):
+        return None
+    user = st.session_state.get('user') or {}
+    return user.get('id')
+
+
 # 簡単なスタイル
 st.markdown("""
 <style>
@@ -332,6 +362,9 @@ if st.session_state.get('page') == 'reg':
                     # Supabaseログ保存エラーは警告のみ（ローカルDB保存は成功しているため）
                     st.warning(f"学習ログ保存に失敗しました: {log_error}")
                 
+                # 水槽で表示する魚画像を事前生成（学習ログ保存後の学習データで作る）
+                pregenerate_fish_images(_tank_user_id())
+                
                 # 評価情報を表示
                 comprehension_text = {1: "①覚えた", 2: "②普通", 3: "③覚えていない"}[comprehension]
                 success_msg = f"動画「{meta['title']}」を登録しました！\n"
@@ -363,6 +396,22 @@ elif st.session_state.get('page') == 'list':
     if not videos:
         st.info("まだ動画が登録されていません。")
     else:
+        # 復習キュー: 期限切れの魚を緊急度順に表示（DB が変わったときだけ読み直す）
+        try:
+            queue = _review_queue()
+            with get_session() as session:
+                queue.sync(session)
+            due = queue.due(datetime.utcnow(), k=5)
+        except Exception as e:
+            st.warning(f"復習キューの取得でエラー: {e}")
+            due = []
+        if due:
+            titles = {v.id: v.title for v in videos}
+            st.markdown("#### 🔔 そろそろ復習")
+            for item in due:
+                st.caption(f"・{titles.get(item.video_id, f'動画ID {item.video_id}')}"
+                           f"（期限: {item.next_due.strftime('%m/%d %H:%M')}）")
+
         for v in videos:
             with st.expander(f"📹 {v.title}", expanded=False):
                 col1, col2, col3 = st.columns([2, 1, 1])
@@ -430,22 +479,25 @@ elif st.session_state.get('page') == 'list':
 
                         if submit_view:
                             with get_session() as s2:
+                                # 復習キューの同期判定用に、書き込む前の DB のフィンガープリントを読んでおく
+                                version_before = load_tank_version(s2)
                                 duration_sec = int(minutes * 60)
                                 new_view = View(video_id=v.id, duration_sec=duration_sec, note=None, comprehension=comp)
                                 s2.add(new_view)
                                 # 対応する Fish を取得して更新（存在しない場合は警告）
                                 f2 = s2.exec(select(Fish).where(Fish.video_id==v.id)).first()
-                                try:
-                                    views_after = s2.exec(select(View).where(View.video_id==v.id)).all()
-                                    view_count = len(views_after)
-                                except Exception:
-                                    view_count = 0
                                 if f2 is None:
                                     st.warning("関連する Fish レコードが見つかりません。Fish は動画登録時に自動作成されます。")
                                 else:
-                                    update_fish_state(f2, datetime.utcnow(), reviewed_today=True, view_count=view_count)
+                                    # 魚の状態は視聴ログ（スナップショット + その後の視聴）から導出して書き込む
+                                    # （減衰係数は起動時の定期推定で更新する）
+                                    record_view_event(s2, f2)
                                     s2.add(f2)
                                 s2.commit()
+                                if f2 is not None:
+                                    # 次回の復習期限が変わったので、復習キューの1匹分だけ差し替える
+                                    _review_queue().update(f2)
+                                    _review_queue().mark_synced(s2, version_before)
                             st.success("視聴を記録しました。")
                             # Use stable API if available; some Streamlit versions removed experimental_rerun
                             try:
@@ -468,6 +520,7 @@ elif st.session_state.get('page') == 'list':
                         if st.button("本当に削除する", key=confirm_key+"_ok"):
                             # トランザクションで関連レコードを削除
                             with get_session() as s3:
+                                version_before = load_tank_version(s3)
                                 # Views を全て削除
                                 views_del = s3.exec(select(View).where(View.video_id==v.id)).all()
                                 for vv in views_del:
@@ -475,12 +528,19 @@ elif st.session_state.get('page') == 'list':
                                 # Fish を削除（もし存在すれば）
                                 fish_del = s3.exec(select(Fish).where(Fish.video_id==v.id)).first()
                                 if fish_del:
+                                    rate_del = s3.get(FishDecayRate, fish_del.id)
+                                    if rate_del:
+                                        s3.delete(rate_del)
+                                    for snap_del in s3.exec(select(FishSnapshot).where(FishSnapshot.fish_id==fish_del.id)).all():
+                                        s3.delete(snap_del)
                                     s3.delete(fish_del)
+                                    _review_queue().remove(fish_del.id)
                                 # Video 本体を削除
                                 v_del = s3.exec(select(Video).where(Video.id==v.id)).first()
                                 if v_del:
                                     s3.delete(v_del)
                                 s3.commit()
+                                _review_queue().mark_synced(s3, version_before)
                             # 確認フラグを消してからリロード
                             st.session_state.pop(confirm_key, None)
                             st.success("削除しました。")
@@ -503,26 +563,33 @@ if st.session_state.get('page') == 'tank':
             st.info("魚の健康度を95%以上にして金のこってぃくんを表示できます")
             
             with get_session() as session:
-                all_fish = session.exec(select(Fish)).all()
-                if all_fish:
+                # 健康度は水槽と同じく読み出し時に計算した現在の値を表示する
+                tank_rows = load_tank_rows(session, now=datetime.utcnow())
+                if tank_rows:
                     fish_options = []
-                    for fish in all_fish:
-                        video = session.exec(select(Video).where(Video.id == fish.video_id)).first()
-                        video_title = video.title if video else f"動画ID {fish.video_id}"
-                        fish_options.append((fish, f"{video_title} (現在の健康度: {fish.health}%)"))
+                    for row in tank_rows:
+                        fish_options.append((row, f"{row.video.title} (現在の健康度: {row.fish.health}%)"))
                     
                     if fish_options:
-                        selected_fish, selected_label = st.selectbox(
+                        selected_row, selected_label = st.selectbox(
                             "健康度を変更する魚を選択:",
                             fish_options,
                             format_func=lambda x: x[1]
                         )
                         
-                        new_health = st.slider("新しい健康度", 0, 100, selected_fish.health)
+                        # 健康度は記憶強度と視聴回数で決まるので、設定できる範囲は視聴回数による
+                        low, high = health_range(selected_row.view_count)
+                        new_health = st.slider("新しい健康度", low, high, min(max(selected_row.fish.health, low), high))
+                        if high < 95:
+                            st.caption("視聴回数が少ないため、金のこってぃくん（95%以上）にはできません")
                         
                         if st.button("健康度を更新"):
-                            selected_fish.health = new_health
-                            session.add(selected_fish)
+                            # 選択肢の魚は計算値を持つ（セッションから切り離し済みの場合もある）ので、行を取り直して書き込む。
+                            # 健康度は読み出し時に s・last_update から計算し直すので、その2つも合わせて書き込む
+                            target_fish = session.get(Fish, selected_row.fish.id)
+                            new_health = set_fish_health(session, target_fish, new_health, datetime.utcnow(),
+                                                         selected_row.view_count)
+                            session.add(target_fish)
                             session.commit()
                             st.success(f"健康度を{new_health}%に更新しました！")
                             if new_health >= 95:
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+魚画像の出力形式ベンチマーク
+PNG（ラスタライズ + PNG 圧縮 + Base64）と SVG の生成速度・データサイズを比較する
+
+    python -m benchmarks.fish_formats [--count 300] [--repeat 3]
+"""
+import time
+import argparse
+from app.lib.dynamic_fish_generator import AdvancedFishGenerator, OUTPUT_FORMATS, fish_image_data_uri
+from app.lib.fish_image_cache import FishImageCache
+from .fish_generation import make_specs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魚画像の出力形式（PNG / SVG）のベンチマーク")
+    parser.add_argument("--count", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # キャッシュなしの生成器で毎回実際に生成させる
+    generator = AdvancedFishGenerator(cache=FishImageCache(cache_dir=None, memory_items=0))
+    specs = make_specs(args.count) + [{"kind": "rare", "achievement_type": a}
+                                      for a in ("streak", "comprehension", "volume", "other")]
+
+    print(f"{'形式':>4} {'匹/秒':>10} {'平均(ms)':>9} {'平均サイズ(B)':>13} {'data URI(B)':>12}")
+    for output_format in OUTPUT_FORMATS:
+        jobs = [generator._spec_job(dict(spec, format=output_format))[1] for spec in specs]
+        generator._render_jobs(jobs[:1])  # 初回のみの初期化を除外
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            images = generator._render_jobs(jobs)
+            best = min(best, time.perf_counter() - start)
+        size = sum(len(image.encode('utf-8')) for image in images) / len(images)
+        uri = sum(len(fish_image_data_uri(image, output_format)) for image in images) / len(images)
+        print(f"{output_format:>4} {len(jobs) / best:>10.0f} {best / len(jobs) * 1000:>9.3f} "
+              f"{size:>13.0f} {uri:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
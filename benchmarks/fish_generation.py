@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+魚画像のバッチ生成ベンチマーク
+直列描画とプロセスプール描画の所要時間を枚数ごとに比較し、損益分岐点を表示する
+（起動済みのプールで比べた値と、プールの起動時間も含めて比べた値の両方）
+
+    python -m benchmarks.fish_generation [--sizes 1,2,4,...] [--repeat 3]
+
+結果を見て app/lib/dynamic_fish_generator.py の PARALLEL_MIN_BATCH を調整する。
+"""
+import time
+import argparse
+from typing import Any, Dict, List
+from app.lib.dynamic_fish_generator import (
+    AdvancedFishGenerator, get_render_executor, render_worker_count, shutdown_render_executor,
+)
+from app.lib.fish_image_cache import FishImageCache
+
+STYLES = ["focused", "varied", "balanced"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+
+def make_specs(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """全て異なる見た目になる生成指定を n 件作成（キャッシュが効かないようにする）"""
+    specs = []
+    for i in range(n):
+        specs.append({
+            "kind": "personalized",
+            "user_stats": {"engagement_score": (seed * 7919 + i) / (n + 1) % 1.0,
+                           "avg_comprehension": 1.0 + (i % 20) / 10},
+            "user_patterns": {"learning_style": STYLES[i % 3],
+                              "preferred_difficulty": DIFFICULTIES[(i // 3) % 3],
+                              "learning_streaks": i % 40},
+            "size": (120, 80),
+        })
+    return specs
+
+
+def _time_batch(generator: AdvancedFishGenerator, n: int, parallel: bool, repeat: int) -> float:
+    """generate_many の直列・並列それぞれの経路と同じ処理を計測（最良値）"""
+    best = float('inf')
+    for r in range(repeat):
+        jobs = [generator._spec_job(spec)[1] for spec in make_specs(n, seed=r)]
+        start = time.perf_counter()
+        if parallel:
+            generator._render_jobs_parallel(jobs)
+        else:
+            generator._render_jobs(jobs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="魚画像バッチ生成のベンチマーク")
+    parser.add_argument("--sizes", default="1,4,16,64,128,256,512,1024")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+
+    cores = render_worker_count()
+    print(f"CPU コア数: {cores}")
+    if cores < 2:
+        print("コアが1つのため generate_many は常に直列で描画します（参考値として計測）")
+
+    # キャッシュなしの生成器で毎回実際に描画させる
+    generator = AdvancedFishGenerator(cache=FishImageCache(cache_dir=None, memory_items=0))
+    generator._render_jobs([generator._spec_job(make_specs(1)[0])[1]])  # 初回のみの初期化を除外
+
+    # プールの起動コスト（初回のみ）を別に計測し、以降は起動済みのプールで比較する
+    start = time.perf_counter()
+    get_render_executor()
+    generator._render_jobs_parallel([generator._spec_job(spec)[1] for spec in make_specs(cores)])
+    startup = time.perf_counter() - start
+    print(f"プロセスプール起動: {startup * 1000:.0f} ms")
+
+    # 以降の全ての枚数で並列の方が速い最小の枚数を損益分岐点とする（起動済み・起動込み）
+    crossover = {'warm': None, 'cold': None}
+    print(f"{'枚数':>6} {'直列(ms)':>10} {'並列(ms)':>10} {'比':>6} {'起動込み比':>10}")
+    try:
+        for n in sizes:
+            serial = _time_batch(generator, n, parallel=False, repeat=args.repeat)
+            parallel = _time_batch(generator, n, parallel=True, repeat=args.repeat)
+            print(f"{n:>6} {serial * 1000:>10.1f} {parallel * 1000:>10.1f} {serial / parallel:>6.2f} "
+                  f"{serial / (parallel + startup):>10.2f}")
+            for name, total in (('warm', parallel), ('cold', parallel + startup)):
+                crossover[name] = (crossover[name] or n) if total < serial else None
+    finally:
+        shutdown_render_executor()
+
+    for name, label in (('warm', "起動済みのプール"), ('cold', "プールの起動込み")):
+        if crossover[name] is None:
+            print(f"{label}: 並列描画が直列より速くなる枚数はありませんでした")
+        else:
+            print(f"{label}: 損益分岐点 約 {crossover[name]} 枚")
+    print("PARALLEL_MIN_BATCH は、最初の並列描画でプールを起動する分も取り戻せるよう起動込みの値を目安にする")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+忘却モデルのベンチマーク
+合成した魚と視聴履歴（N 匹 × D 日）で、スカラー版・一括版・予測・DB への書き戻しの
+処理速度（ops/秒）とピークメモリを計測し、JSON で出力する
+
+    python -m benchmarks.forgetting_model [--fish 100000] [--days 365] [--output result.json]
+
+モデルや保存方法を変えたら、変更前後の JSON を比較して性能の劣化がないか確認する。
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict
+import numpy as np
+from sqlalchemy import insert, update
+from sqlmodel import SQLModel, Session, create_engine
+from app.lib.models import Fish, Video
+from app.lib.forgetting import update_fish_state, update_fish_states_batch, project_health
+
+START = datetime(2025, 1, 1)
+
+
+def make_history(n_fish: int, n_days: int, review_rate: float = 0.05, seed: int = 0) -> Dict[str, np.ndarray]:
+    """
+    合成の魚と視聴履歴を作成
+
+    Returns:
+        dict: s・weight_g（初期値, (N,)）と reviews（日ごとの復習フラグ, (D, N)）
+    """
+    rng = np.random.default_rng(seed)
+    # 魚ごとに復習の頻度を変える（よく見る動画・ほとんど見ない動画）
+    rates = np.clip(rng.gamma(2.0, review_rate / 2.0, n_fish), 0.0, 1.0)
+    return {
+        's': rng.uniform(0.3, 1.0, n_fish),
+        'weight_g': rng.integers(50, 150, n_fish).astype(float),
+        'reviews': rng.random((n_days, n_fish)) < rates,
+    }
+
+
+def simulate_scalar(history: Dict[str, np.ndarray], n_fish: int) -> np.ndarray:
+    """先頭 n_fish 匹を update_fish_state で1日ずつ更新（最終日の健康度を返す）"""
+    reviews = history['reviews'][:, :n_fish].tolist()
+    fish = [SimpleNamespace(s=float(s), weight_g=int(w), last_update=START, health=0, status='alive', next_due=None)
+            for s, w in zip(history['s'][:n_fish], history['weight_g'][:n_fish])]
+    counts = [0] * n_fish
+    for d, day_reviews in enumerate(reviews):
+        now = START + timedelta(days=d + 1)
+        for i, f in enumerate(fish):
+            reviewed = day_reviews[i]
+            counts[i] += reviewed
+            update_fish_state(f, now, reviewed_today=reviewed, view_count=counts[i])
+    return np.array([f.health for f in fish])
+
+
+def simulate_batch(history: Dict[str, np.ndarray], n_fish: int) -> Dict[str, np.ndarray]:
+    """先頭 n_fish 匹を update_fish_states_batch で1日ずつ一括更新（最終状態を返す）"""
+    s = history['s'][:n_fish].copy()
+    weight = history['weight_g'][:n_fish].copy()
+    last = np.full(n_fish, np.datetime64(START, 'us'))
+    counts = np.zeros(n_fish, dtype=int)
+    result = {}
+    for d, reviewed in enumerate(history['reviews'][:, :n_fish]):
+        now = START + timedelta(days=d + 1)
+        counts += reviewed
+        result = update_fish_states_batch(s, last, weight, counts, now, reviewed_today=reviewed)
+        s, weight = result['s'], result['weight_g']
+        last[:] = np.datetime64(now, 'us')
+    return result
+
+
+def project_year(history: Dict[str, np.ndarray], n_fish: int) -> np.ndarray:
+    """復習しなかった場合の健康度を全ての魚 × 全ての日で予測"""
+    n_days = history['reviews'].shape[0]
+    times = np.datetime64(START, 'us') + np.arange(1, n_days + 1) * np.timedelta64(1, 'D')
+    last = np.full(n_fish, np.datetime64(START, 'us'))
+    counts = history['reviews'][:, :n_fish].sum(axis=0)
+    return project_health(history['s'][:n_fish], last, counts, times)
+
+
+def write_back(state: Dict[str, np.ndarray], n_fish: int) -> float:
+    """一時 SQLite に n_fish 匹を作成し、最終状態を主キー指定の bulk UPDATE で書き戻す（書き戻しのみ計測）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as ses:
+            ses.exec(insert(Video), params=[{'id': i + 1, 'url': f'u{i}', 'video_id': f'v{i}', 'title': f't{i}'}
+                                            for i in range(n_fish)])
+            ses.exec(insert(Fish), params=[{'id': i + 1, 'video_id': i + 1} for i in range(n_fish)])
+            ses.commit()
+
+            now = START + timedelta(days=365)
+            next_due = state['next_due'].tolist()
+            params = [
+                {'id': i + 1, 's': float(state['s'][i]), 'health': int(state['health'][i]),
+                 'status': str(state['status'][i]), 'weight_g': int(state['weight_g'][i]),
+                 'last_update': now, 'next_due': next_due[i]}
+                for i in range(n_fish)
+            ]
+            start = time.perf_counter()
+            ses.exec(update(Fish), params=params)
+            ses.commit()
+            elapsed = time.perf_counter() - start
+        engine.dispose()
+    return elapsed
+
+
+def measure(fn: Callable[[], Any], ops: int, memory: bool) -> Dict[str, Any]:
+    """
+    fn を1回実行して所要時間と ops/秒を計測（memory=True ならもう1回実行してピークメモリも計測）
+
+    fn が float を返した場合は、準備を除いた所要時間（秒）としてその値を使う。
+    """
+    start = time.perf_counter()
+    timed = fn()
+    elapsed = timed if isinstance(timed, float) else time.perf_counter() - start
+    result = {'ops': ops, 'seconds': round(elapsed, 4), 'ops_per_sec': round(ops / elapsed, 1) if elapsed else None}
+    if memory:
+        # tracemalloc は計測対象を遅くするので、時間とは別の実行で測る
+        tracemalloc.start()
+        fn()
+        result['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _max_rss_kb():
+    """プロセス全体の最大常駐メモリ（KB、取得できない環境では None）"""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss // 1024 if sys.platform == 'darwin' else rss
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="忘却モデルのベンチマーク（結果は JSON）")
+    parser.add_argument("--fish", type=int, default=100000, help="一括版・予測・書き戻しの魚の数")
+    parser.add_argument("--days", type=int, default=365, help="シミュレーションする日数")
+    parser.add_argument("--scalar-fish", type=int, default=200, help="スカラー版で計測する魚の数（遅いので一部だけ）")
+    parser.add_argument("--review-rate", type=float, default=0.05, help="1日あたりの平均復習率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="ピークメモリを計測しない")
+    parser.add_argument("--output", help="JSON の出力先（省略時は標準出力）")
+    args = parser.parse_args()
+
+    memory = not args.no_memory
+    history = make_history(args.fish, args.days, args.review_rate, args.seed)
+    scalar_fish = min(args.scalar_fish, args.fish)
+
+    cases = {
+        'scalar': measure(lambda: simulate_scalar(history, scalar_fish), scalar_fish * args.days, memory),
+        'batch': measure(lambda: simulate_batch(history, args.fish), args.fish * args.days, memory),
+        'project': measure(lambda: project_year(history, args.fish), args.fish * args.days, memory),
+    }
+    final = simulate_batch(history, args.fish)
+    cases['db_write_back'] = measure(lambda: write_back(final, args.fish), args.fish, memory)
+
+    # スカラー版と一括版の結果が一致しているか（実装を比較するときの確認用）
+    scalar_health = simulate_scalar(history, scalar_fish)
+    batch_health = simulate_batch(history, scalar_fish)['health']
+    mismatch = int(np.count_nonzero(scalar_health != batch_health))
+
+    report = {
+        'params': {'fish': args.fish, 'days': args.days, 'scalar_fish': scalar_fish,
+                   'review_rate': args.review_rate, 'seed': args.seed,
+                   'reviews': int(history['reviews'].sum())},
+        'env': {'python': platform.python_version(), 'numpy': np.__version__,
+                'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'cases': cases,
+        'scalar_batch_mismatch': mismatch,
+        'max_rss_kb': _max_rss_kb(),
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if mismatch:
+        print(f"警告: スカラー版と一括版の健康度が {mismatch} 匹で一致しません", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
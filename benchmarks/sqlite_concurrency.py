@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite の同時書き込みベンチマーク
+複数スレッドから視聴を記録し（視聴フォームと同じ処理）、同時に水槽の読み込みも行って、
+SQLite の既定の設定と app/lib/db.py の設定（WAL など）でスループット・待ち時間・ロックエラーを比較する
+
+    python -m benchmarks.sqlite_concurrency [--writers 16] [--views 50] [--readers 4]
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session, select
+from app.lib.db import create_db_engine
+from app.lib.models import Fish, Video, View
+from app.lib.fish_events import record_view_event
+from app.lib.tank_data import load_tank_rows
+
+
+def _seed(engine, n_videos: int):
+    SQLModel.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with Session(engine) as ses:
+        ses.exec(insert(Video), params=[{'id': i + 1, 'url': f'u{i}', 'video_id': f'v{i}', 'title': f't{i}',
+                                         'created_at': now} for i in range(n_videos)])
+        ses.exec(insert(Fish), params=[{'id': i + 1, 'video_id': i + 1, 'last_update': now}
+                                       for i in range(n_videos)])
+        ses.commit()
+
+
+def _record_view(engine, video_id: int, comprehension: int):
+    """main.py の視聴フォームと同じ処理（視聴の追加・魚の状態の導出）"""
+    with Session(engine) as ses:
+        ses.add(View(video_id=video_id, viewed_at=datetime.utcnow(), comprehension=comprehension))
+        fish = ses.exec(select(Fish).where(Fish.video_id == video_id)).first()
+        record_view_event(ses, fish)
+        ses.add(fish)
+        ses.commit()
+
+
+def run(tuned: bool, writers: int, views: int, readers: int, n_videos: int) -> Dict[str, float]:
+    """一時 DB で writers スレッド × views 件の視聴を記録し、その間 readers スレッドが水槽を読み続ける"""
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", tuned=tuned)
+        _seed(engine, n_videos)
+
+        latencies: List[float] = []
+        errors: List[str] = []
+        reads = [0]
+        lock = threading.Lock()
+        done = threading.Event()
+        start_barrier = threading.Barrier(writers + readers + 1)
+
+        def writer(seed: int):
+            rng = np.random.default_rng(seed)
+            start_barrier.wait()
+            for _ in range(views):
+                started = time.perf_counter()
+                try:
+                    _record_view(engine, int(rng.integers(1, n_videos + 1)), int(rng.integers(1, 4)))
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+                except Exception as e:
+                    with lock:
+                        errors.append(type(e).__name__)
+
+        def reader():
+            start_barrier.wait()
+            while not done.is_set():
+                try:
+                    with Session(engine) as ses:
+                        load_tank_rows(ses, now=datetime.utcnow())
+                    with lock:
+                        reads[0] += 1
+                except Exception as e:
+                    with lock:
+                        errors.append(type(e).__name__)
+
+        writer_threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+        for t in writer_threads + reader_threads:
+            t.start()
+        start_barrier.wait()
+        started = time.perf_counter()
+        for t in writer_threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for t in reader_threads:
+            t.join()
+        engine.dispose()
+
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        'views_per_sec': len(latencies) / elapsed,
+        'reads_per_sec': reads[0] / elapsed,
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p99_ms': float(np.percentile(lat, 99)),
+        'max_ms': float(lat.max()),
+        'errors': len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite の同時書き込みベンチマーク（既定の設定と WAL などの設定を比較）")
+    parser.add_argument("--writers", type=int, default=16, help="視聴を記録するスレッド数")
+    parser.add_argument("--views", type=int, default=50, help="スレッドごとの記録件数")
+    parser.add_argument("--readers", type=int, default=4, help="水槽を読み続けるスレッド数")
+    parser.add_argument("--videos", type=int, default=200, help="動画（魚）の数")
+    args = parser.parse_args()
+
+    print(f"書き込み {args.writers} スレッド × {args.views} 件、読み込み {args.readers} スレッド、魚 {args.videos} 匹")
+    print(f"{'設定':>6} {'記録/秒':>9} {'読込/秒':>9} {'p50(ms)':>9} {'p99(ms)':>9} {'最大(ms)':>9} {'エラー':>6}")
+    for label, tuned in (("既定", False), ("調整", True)):
+        r = run(tuned, args.writers, args.views, args.readers, args.videos)
+        print(f"{label:>6} {r['views_per_sec']:>9.1f} {r['reads_per_sec']:>9.1f} {r['p50_ms']:>9.1f} "
+              f"{r['p99_ms']:>9.1f} {r['max_ms']:>9.1f} {r['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+tank_data のテスト（健康度の編集が読み出し時の計算でも保たれるか）
+
+    python -m pytest tests
+"""
+from datetime import datetime, timedelta
+import pytest
+from sqlmodel import SQLModel, Session, create_engine
+from app.lib.models import Fish, Video, View
+from app.lib.forgetting import project_health
+from app.lib.tank_data import health_range, load_tank_rows, set_fish_health
+
+NOW = datetime(2026, 3, 10, 12, 0)
+
+
+@pytest.fixture
+def ses(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tank.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        # 2回視聴して10日前に最後に更新された魚（読み出し時に減衰を計算し直す対象）
+        session.add(Video(id=1, url='u', video_id='v', title='t'))
+        session.add(Fish(id=1, video_id=1, s=0.8, health=60, last_update=NOW - timedelta(days=10)))
+        session.add(View(video_id=1, viewed_at=NOW - timedelta(days=12), comprehension=2))
+        session.add(View(video_id=1, viewed_at=NOW - timedelta(days=10), comprehension=2))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def _edit(ses, health, now=NOW):
+    row = load_tank_rows(ses, now=now)[0]
+    fish = ses.get(Fish, row.fish.id)
+    result = set_fish_health(ses, fish, health, now, row.view_count)
+    ses.add(fish)
+    ses.commit()
+    return result
+
+
+@pytest.mark.parametrize("health", [95, 60, 40])
+def test_edited_health_survives_reload(ses, health):
+    assert _edit(ses, health) == health
+    assert load_tank_rows(ses, now=NOW)[0].fish.health == health
+    # 同じ日の後の時刻でも、保存した値のまま
+    assert load_tank_rows(ses, now=NOW + timedelta(hours=6))[0].fish.health == health
+
+
+def test_edited_health_decays_from_edit(ses):
+    _edit(ses, 80)
+    later = NOW + timedelta(days=2)
+    fish = ses.get(Fish, 1)
+    expected = project_health([fish.s], [fish.last_update], [2], [later])[0, 0]
+    assert load_tank_rows(ses, now=later)[0].fish.health == expected
+
+
+@pytest.mark.parametrize("health", [0, 100])
+def test_health_outside_range_is_clamped(ses, health):
+    # 視聴回数で決まる範囲（2回なら 25..95）の端に丸める
+    low, high = health_range(2)
+    result = _edit(ses, health)
+    assert result == min(max(health, low), high)
+    assert load_tank_rows(ses, now=NOW)[0].fish.health == result